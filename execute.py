@@ -1,14 +1,46 @@
 #!/usr/bin/env python2.7
 import argparse
+import collections
 import datetime
 import errno
+import json
 import logging
+import multiprocessing
 import nose
 import os
+import Queue
+import socket
+import subprocess
 import sys
+import time
+import zlib
+from utils import benchmark, cache, capacity, generators, resources, responses, timing, trace
+from utils import matrix, transport
+from utils.histogram import LatencyHistogram
+from xml.etree import ElementTree
 
 LOG = logging.getLogger(__name__)
 
+ROOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Tests executed by every process when running with several workers
+CONCURRENT_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_concurrent.py")
+# Tests executed in soak mode
+SOAK_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_soak.py")
+# Tests executed in capacity mode
+CAPACITY_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_capacity.py")
+# Tests executed by the listing benchmark
+LISTING_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_listing.py")
+# Tests executed by the transport benchmark
+TRANSPORT_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_transport.py")
+# Tests executed by the scaling matrix
+MATRIX_TESTS = os.path.join(ROOT_DIRECTORY, "tests", "test_matrix.py")
+# Options that run their own tests instead of the suite: (dest, option, tests)
+MODES = (("soak_duration", "--soak-duration", SOAK_TESTS),
+         ("capacity_slo", "--capacity-slo", CAPACITY_TESTS),
+         ("list_sizes", "--list-sizes", LISTING_TESTS),
+         ("transport_benchmark", "--transport-benchmark", TRANSPORT_TESTS),
+         ("matrix_concurrency", "--matrix-concurrency", MATRIX_TESTS))
+
 class EnabledByDefaultPlugin(nose.plugins.base.Plugin):
   def __init__(self, name):
     super(EnabledByDefaultPlugin, self).__init__()
@@ -31,10 +63,83 @@ class TFContextPlugin(EnabledByDefaultPlugin):
       if hasattr(context, attr):
         setattr(context, attr, value)
 
-def run_tests(nose_args, server_url, server_port, skip_ssl, output_directory, *args, **kwargs):
+class ShardPlugin(EnabledByDefaultPlugin):
+  """
+  Select only the tests of one shard of the suite. The shards are assigned by the parent
+  process with balance_shards, a test missing from the assignment belongs to the shard given
+  by the hash of its name. Generator tests are assigned as a whole.
+  """
+  def __init__(self, index, count, assignment=None):
+    super(ShardPlugin, self).__init__("shard")
+    self.index = index
+    self.count = count
+    self.assignment = assignment or {}
+
+  def wantMethod(self, method):
+    cls = method.im_class
+    return self._want("%s.%s.%s" % (cls.__module__, cls.__name__, method.__name__))
+
+  def wantFunction(self, function):
+    return self._want("%s.%s" % (function.__module__, function.__name__))
+
+  def _want(self, name):
+    shard = self.assignment.get(name)
+    if shard is None:
+      shard = (zlib.crc32(name) & 0xffffffff) % self.count
+    # None lets nose decide for the tests of this shard
+    if shard != self.index:
+      return False
+    return None
+
+class CollectPlugin(EnabledByDefaultPlugin):
+  """
+  Count the cases of every test of the suite, a generator test has one per yielded case.
+  """
+  def __init__(self):
+    super(CollectPlugin, self).__init__("collect")
+    self.cases = collections.OrderedDict()
+
+  def startTest(self, test):
+    name = test_name(test.id())
+    self.cases[name] = self.cases.get(name, 0) + 1
+
+def test_name(case):
+  """
+  :param case: id of a test case, the cases of a generator test end with their arguments
+  :return: name of the test the case belongs to
+  """
+  return case.split("(", 1)[0]
+
+def run_tests(nose_args, server_url, server_port, skip_ssl, output_directory, pool_size,
+              keep_alive, max_retries, retry_backoff, transport, transport_benchmark,
+              pipeline_depth, load_concurrency, load_rate, load_requests,
+              arrival_rate, arrival_rate_end, arrival_duration, max_in_flight, verify_games,
+              gameplay_games, game_pool_size, gameplay_polls, game_cache_size, request_timings,
+              json_decoder, validation_sample, strict_schemas, failure_body_limit, dump_failures,
+              fuzz_combinations, seed, secure_random, record_trace, replay_trace, replay_speed,
+              soak_duration, soak_rate, soak_window, soak_degradation, soak_error_rate_growth,
+              capacity_slo, capacity_percentile, capacity_error_rate, capacity_mode,
+              capacity_search, capacity_start, capacity_limit, capacity_step_duration,
+              capacity_endpoints, list_page_size, list_sizes, matrix_concurrency,
+              matrix_keep_alive, matrix_sizes, matrix_endpoints, matrix_duration,
+              matrix_error_rate, server_pid, resource_interval,
+              results_queue=None, shard=None, sample_resources=True, *args, **kwargs):
   LOG.info("Running tests")
   # Send the current local variables to the plugin
-  plugin = TFContextPlugin(test_params=locals())
+  plugins = [TFContextPlugin(test_params=locals())]
+  if shard is not None:
+    plugins.append(ShardPlugin(*shard))
+  generators.seed(seed, secure_random)
+  if game_cache_size:
+    cache.CACHE = cache.GameCache(game_cache_size)
+  sampler = None
+  if server_pid:
+    benchmark.TIMELINE = benchmark.Timeline(resource_interval)
+    if sample_resources:
+      sampler = resources.ResourceSampler(server_pid, resource_interval, server_port)
+      sampler.start()
+  if record_trace:
+    trace.RECORDER = trace.TraceRecorder(os.path.join(output_directory, record_trace))
   start = datetime.datetime.now()
   runner = nose.main(
       exit=False,
@@ -43,19 +148,274 @@ def run_tests(nose_args, server_url, server_port, skip_ssl, output_directory, *a
             "--exe",
             "--xunit-file=%s/nosetests.xml" % output_directory,
             "--nologcapture"] + nose_args,
-      addplugins=[plugin],
+      addplugins=plugins,
       **kwargs)
 
   end = datetime.datetime.now()
   LOG.info("Total time: {0}".format(end - start))
+  if request_timings:
+    timing.RECORDER.write(os.path.join(output_directory, "timings.json"))
+    if results_queue is not None:
+      results_queue.put(("timings", None, timing.RECORDER.to_dict()))
+  if trace.RECORDER is not None:
+    trace.RECORDER.close()
+    trace.RECORDER = None
+  if cache.CACHE is not None:
+    report = cache.CACHE.report()
+    LOG.info("Game cache: {lookups} reads, {hit_ratio:.2%} answered by the cache, "
+             "{saved_ratio:.2%} didn't reach the server".format(**report))
+    if results_queue is not None:
+      results_queue.put(("cache", None, report))
+    else:
+      benchmark.REPORT.cache = report
+    cache.CACHE = None
+  if benchmark.TIMELINE is not None:
+    samples = sampler.stop() if sampler is not None else []
+    if results_queue is not None:
+      results_queue.put(("timeline", None, {"timeline": benchmark.TIMELINE.to_dict(),
+                                            "samples": samples}))
+    else:
+      benchmark.REPORT.timeline = resources.align(benchmark.TIMELINE.rows(), samples,
+                                                  resource_interval)
+    benchmark.TIMELINE = None
   return runner.success
 
+def run_workers(workers, output_directory, **test_params):
+  """
+  Run the concurrency tests in several processes so the load isn't limited by a single
+  interpreter.
+  :param workers: number of processes
+  :param output_directory: directory in which the merged results are written
+  :param test_params: arguments for run_tests
+  :return: True if the tests passed in every worker
+  """
+  LOG.info("Running concurrency tests in %s workers" % workers)
+  worker_params = [dict(test_params, nose_args=[CONCURRENT_TESTS]) for _ in xrange(workers)]
+  return run_processes(worker_params, output_directory)
+
+def run_parallel(processes, output_directory, **test_params):
+  """
+  Distribute the tests of the suite between several processes, every test runs once.
+  :param processes: number of processes
+  :param output_directory: directory in which the merged results are written
+  :param test_params: arguments for run_tests
+  :return: True if the tests passed in every process
+  """
+  LOG.info("Running tests in %s processes" % processes)
+  cases = collect_tests(test_params["nose_args"])
+  durations = recorded_durations(os.path.join(output_directory, "nosetests.xml"))
+  assignment = balance_shards(cases, durations, processes)
+  for index in xrange(processes):
+    tests = [name for name, shard in assignment.items() if shard == index]
+    LOG.info("Process %s runs %s tests with %s cases" % (
+      index, len(tests), sum(cases[name] for name in tests)))
+  worker_params = [dict(test_params, shard=(index, processes, assignment))
+                   for index in xrange(processes)]
+  return run_processes(worker_params, output_directory, prefix_classnames=False)
+
+def collect_tests(nose_args):
+  """
+  Load the suite without running it.
+  :param nose_args: arguments selecting the tests
+  :return: OrderedDict with the number of cases of every test by name
+  """
+  plugin = CollectPlugin()
+  with open(os.devnull, "w") as devnull:
+    nose.run(argv=["nosetests", "--collect-only", "--exe"] + nose_args, addplugins=[plugin],
+             testRunner=nose.core.TextTestRunner(stream=devnull))
+  return plugin.cases
+
+def recorded_durations(xunit_file):
+  """
+  :param xunit_file: xunit file of a previous run, it may not exist
+  :return: dict with the seconds every test took by name
+  """
+  durations = dict()
+  if not os.path.exists(xunit_file):
+    return durations
+  for testcase in ElementTree.parse(xunit_file).getroot().findall("testcase"):
+    name = "%s.%s" % (testcase.get("classname"), test_name(testcase.get("name")))
+    durations[name] = durations.get(name, 0.0) + float(testcase.get("time", 0))
+  return durations
+
+def balance_shards(cases, durations, count):
+  """
+  Assign the tests to the shards largest first, every test goes to the shard with the least
+  work so far. The work of a test is the time it took in the previous run, ties like the tests
+  without a recorded duration are broken by their number of cases.
+  :param cases: dict with the number of cases of every test by name
+  :param durations: dict with the seconds of the tests recorded by a previous run
+  :param count: number of shards
+  :return: dict with the index of the shard of every test by name
+  """
+  loads = [(0.0, 0)] * count
+  assignment = dict()
+  work = dict((name, (durations.get(name, 0.0), number)) for name, number in cases.items())
+  for name in sorted(work, key=lambda name: (work[name][0], work[name][1], name), reverse=True):
+    index = loads.index(min(loads))
+    assignment[name] = index
+    loads[index] = (loads[index][0] + work[name][0], loads[index][1] + work[name][1])
+  return assignment
+
+def run_processes(worker_params, output_directory, prefix_classnames=True):
+  """
+  Run the tests in a process for every set of parameters. Every worker sends the results
+  of its load scenarios and its request timings back through a queue and writes its own
+  xunit file, the results are merged in benchmark.REPORT, the timings in timings.json and
+  the xunit files in a single file.
+  :param worker_params: list of arguments for run_tests, one per process
+  :param output_directory: directory in which the merged results are written
+  :param prefix_classnames: prefix the tests in the xunit file with the worker name
+  :return: True if the tests passed in every worker
+  """
+  queue = multiprocessing.Queue()
+  processes = list()
+  xunit_files = list()
+  # Client timelines of the workers and resources of the server sampled by the first one
+  timelines = None
+  samples = list()
+  cache_reports = list()
+  timings = None
+  for worker, params in enumerate(worker_params):
+    worker_directory = os.path.join(output_directory, "worker-%d" % worker)
+    make_directory(worker_directory)
+    xunit_files.append(os.path.join(worker_directory, "nosetests.xml"))
+    params = dict(params, output_directory=worker_directory, results_queue=queue,
+                  sample_resources=worker == 0)
+    processes.append(multiprocessing.Process(target=_run_worker, args=(params, )))
+
+  for process in processes:
+    process.start()
+  # The queue has to be drained while the workers run, otherwise they block when exiting
+  while any(process.is_alive() for process in processes) or not queue.empty():
+    try:
+      kind, name, result = queue.get(timeout=1)
+    except Queue.Empty:
+      continue
+    if kind == "cache":
+      cache_reports.append(result)
+      continue
+    if kind == "timings":
+      recorder = timing.TimingRecorder.from_dict(result)
+      timings = recorder if timings is None else timings.merge(recorder)
+      continue
+    if kind == "timeline":
+      timeline = benchmark.Timeline.from_dict(result["timeline"])
+      if timelines is None:
+        timelines = timeline
+      else:
+        timelines.merge(timeline)
+      samples.extend(result["samples"])
+      continue
+    benchmark.REPORT.server_version = result["server_version"]
+    benchmark.REPORT.add(name, LatencyHistogram.from_dict(result["latencies"]),
+                         result["operations"], result["errors"], result["duration"])
+  for process in processes:
+    process.join()
+  if cache_reports:
+    benchmark.REPORT.cache = cache.combine(cache_reports)
+  if timings is not None:
+    timings.write(os.path.join(output_directory, "timings.json"))
+  if timelines is not None:
+    benchmark.REPORT.timeline = resources.align(timelines.rows(), samples, timelines.interval)
+  merge_xunit(xunit_files, os.path.join(output_directory, "nosetests.xml"),
+              prefix_classnames)
+  return all(process.exitcode == 0 for process in processes)
+
+def _run_worker(params):
+  sys.exit(0 if run_tests(**params) else 1)
+
+def merge_xunit(xunit_files, output_file, prefix_classnames=True):
+  """
+  Merge the xunit files written by the workers in a single test suite.
+  :param xunit_files: list of xunit files
+  :param output_file: file in which the merged suite is written
+  :param prefix_classnames: prefix the test cases with the name of the directory of the
+  worker so they don't collide when the workers run the same tests
+  """
+  counters = ("tests", "errors", "failures", "skip")
+  merged = ElementTree.Element("testsuite", name="nosetests")
+  totals = dict((counter, 0) for counter in counters)
+  for xunit_file in xunit_files:
+    if not os.path.exists(xunit_file):
+      LOG.error("Missing xunit file %s" % xunit_file)
+      totals["errors"] += 1
+      continue
+    suite = ElementTree.parse(xunit_file).getroot()
+    for counter in counters:
+      totals[counter] += int(suite.get(counter, 0))
+    for testcase in suite.findall("testcase"):
+      if prefix_classnames:
+        prefix = os.path.basename(os.path.dirname(xunit_file))
+        testcase.set("classname", "%s.%s" % (prefix, testcase.get("classname")))
+      merged.append(testcase)
+  for counter in counters:
+    merged.set(counter, str(totals[counter]))
+  ElementTree.ElementTree(merged).write(output_file, encoding="UTF-8", xml_declaration=True)
+
+def check_benchmark(output_directory, baseline=None, **tolerances):
+  """
+  Write the benchmark report of the load scenarios and compare it against a baseline.
+  :param output_directory: directory in which benchmark.json and benchmark.csv are written
+  :param baseline: path of the benchmark.json of a previous run
+  :param tolerances: tolerances for utils.benchmark.compare
+  :return: False if a scenario regressed
+  """
+  report = benchmark.REPORT.write(output_directory)
+  for name, scenario in sorted(report["scenarios"].items()):
+    LOG.info("{0}: {operations} operations, {throughput:.2f}/s, {error_rate:.2%} errors, "
+             "p50 {latency[p50]:.4f}s, p99 {latency[p99]:.4f}s".format(name, **scenario))
+  if baseline is None:
+    return True
+  with open(baseline) as f:
+    regressions = benchmark.compare(json.load(f), report, **tolerances)
+  for regression in regressions:
+    LOG.error("Regression in %s" % regression)
+  return not regressions
+
+def start_local_server(port, workers=1, timeout=10):
+  """
+  Start the stand-in server of utils.server in another process.
+  :param port: port the server listens on
+  :param workers: number of worker processes of the server
+  :param timeout: seconds to wait for the server to accept connections
+  :return: subprocess.Popen object of the server
+  """
+  LOG.info("Starting local server on port %s with %s workers" % (port, workers))
+  server = subprocess.Popen([sys.executable, "-m", "utils.server", "--port", str(port),
+                             "--workers", str(workers)], cwd=ROOT_DIRECTORY)
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    try:
+      socket.create_connection(("localhost", port), timeout=1).close()
+      return server
+    except socket.error:
+      if server.poll() is not None:
+        break
+      time.sleep(0.1)
+  server.kill()
+  raise RuntimeError("The local server didn't start on port %s" % port)
+
+def make_directory(path):
+  try:
+    os.mkdir(path)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+        raise e
+    pass
+
 if __name__ == "__main__":
   parser = argparse.ArgumentParser()
   parser.add_argument("--nose-args", action="store", default=[], dest="nose_args",
                       help="Extra nose arguments")
-  parser.add_argument("--server-url", action="store", required=True, dest="server_url",
+  parser.add_argument("--server-url", action="store", default=None, dest="server_url",
                       help="Server that is going to be tested.")
+  parser.add_argument("--local-server", action="store_true", default=False, dest="local_server",
+                      help="Start the stand-in server of utils.server in --server-port and test "
+                           "it instead of --server-url.")
+  parser.add_argument("--local-server-workers", action="store", default=1,
+                      dest="local_server_workers", type=int,
+                      help="Worker processes of the local server, each one runs an event loop.")
   parser.add_argument("--skip-ssl-verification", action="store", default=False, dest="skip_ssl",
                       help="Skip ssl validation if server is in https.")
   parser.add_argument("--server-port", action="store", default=8080, dest="server_port",
@@ -63,13 +423,250 @@ if __name__ == "__main__":
   parser.add_argument("--xml-output", "-o", action="store", default="results",
                       dest="output_directory",
                       help="Directory in which the xml results are going to be written.")
+  parser.add_argument("--pool-size", action="store", default=10, dest="pool_size", type=int,
+                      help="Number of pooled connections kept by the session of each thread.")
+  parser.add_argument("--no-keep-alive", action="store_false", default=True, dest="keep_alive",
+                      help="Close the connection after every request.")
+  parser.add_argument("--max-retries", action="store", default=0, dest="max_retries", type=int,
+                      help="Number of times a failed connection is retried.")
+  parser.add_argument("--retry-backoff", action="store", default=0, dest="retry_backoff",
+                      type=float, help="Backoff factor in seconds between retries.")
+  parser.add_argument("--transport", action="store", default="requests", dest="transport",
+                      choices=transport.TRANSPORTS,
+                      help="Backend of the HTTP calls, raw is a lean HTTP/1.1 client on "
+                           "persistent sockets so the load tests measure the server rather "
+                           "than the client library.")
+  parser.add_argument("--transport-benchmark", action="store", default=None,
+                      dest="transport_benchmark", type=int,
+                      help="Run only the transport benchmark, this number of calls is made "
+                           "with every transport and the requests per CPU second of the "
+                           "client are written to transport.json.")
+  parser.add_argument("--pipeline-depth", action="store", default=10, dest="pipeline_depth",
+                      type=int, help="Calls pipelined at once by the transport benchmark.")
+  parser.add_argument("--concurrency", action="store", default=20, dest="load_concurrency",
+                      type=int, help="Requests in flight during the concurrency tests.")
+  parser.add_argument("--rate", action="store", default=None, dest="load_rate", type=float,
+                      help="Target requests per second of the concurrency tests, "
+                           "as fast as possible by default.")
+  parser.add_argument("--requests", action="store", default=10000, dest="load_requests",
+                      type=int, help="Number of requests made by the concurrency tests.")
+  parser.add_argument("--arrival-rate", action="store", default=None, dest="arrival_rate",
+                      type=float, help="Requests per second sent by the open loop test, "
+                                       "the test is skipped if it isn't given.")
+  parser.add_argument("--arrival-rate-end", action="store", default=None,
+                      dest="arrival_rate_end", type=float,
+                      help="Ramp the open loop rate linearly up to this rate.")
+  parser.add_argument("--arrival-duration", action="store", default=60,
+                      dest="arrival_duration", type=float,
+                      help="Duration in seconds of the open loop test.")
+  parser.add_argument("--max-in-flight", action="store", default=1000, dest="max_in_flight",
+                      type=int, help="Threads sending the requests of the open loop test.")
+  parser.add_argument("--games", action="store", default=50, dest="gameplay_games", type=int,
+                      help="Number of whole games played concurrently by the gameplay test.")
+  parser.add_argument("--game-pool-size", action="store", default=25, dest="game_pool_size",
+                      type=int, help="Games created at once for the tests that need a new game.")
+  parser.add_argument("--no-verify-games", action="store_false", default=True,
+                      dest="verify_games",
+                      help="Don't check that the games created by the load tests exist, are "
+                           "unique and are listed.")
+  parser.add_argument("--gameplay-polls", action="store", default=1, dest="gameplay_polls",
+                      type=int, help="Reads of the game state after every action of the "
+                                     "gameplay tests.")
+  parser.add_argument("--game-cache-size", action="store", default=0, dest="game_cache_size",
+                      type=int, help="Cache up to this number of games read by get_game, "
+                                     "revalidating them with their ETag. 0 disables the cache.")
+  parser.add_argument("--request-timings", action="store_true", default=False,
+                      dest="request_timings",
+                      help="Record the DNS, connect, TLS, time to first byte, download and json "
+                           "decoding time of the requests in timings.json.")
+  parser.add_argument("--json-decoder", action="store", default="auto", dest="json_decoder",
+                      choices=responses.DECODERS,
+                      help="Json module used to parse the responses, auto picks the fastest "
+                           "one installed.")
+  parser.add_argument("--validation-sample", action="store", default=1.0,
+                      dest="validation_sample", type=float,
+                      help="Fraction of the responses whose schema is validated, lower it to "
+                           "take the validation off the load threads.")
+  parser.add_argument("--strict-schemas", action="store_true", default=False,
+                      dest="strict_schemas",
+                      help="Check the types of the fields of the responses, not only their "
+                           "keys.")
+  parser.add_argument("--failure-body-limit", action="store", default=2000,
+                      dest="failure_body_limit", type=int,
+                      help="Characters of the response content shown when a test fails.")
+  parser.add_argument("--dump-failures", action="store_true", default=False,
+                      dest="dump_failures",
+                      help="Write the whole request and response of every failed assertion to "
+                           "the failures directory of the output.")
+  parser.add_argument("--fuzz", action="store", default=None, dest="fuzz_combinations",
+                      type=int, help="Run the fuzz tests, adding this number of random "
+                                     "combinations of fuzzed fields to the corpora.")
+  parser.add_argument("--seed", action="store", default=None, dest="seed", type=int,
+                      help="Seed of the random test data, the seed of every run is logged so "
+                           "a failure can be repeated.")
+  parser.add_argument("--secure-random", action="store_true", default=False,
+                      dest="secure_random",
+                      help="Generate the random test data from the system's cryptographic "
+                           "source, the seed is ignored.")
+  parser.add_argument("--record-trace", action="store", default=None, dest="record_trace",
+                      help="Write every call made to the API in this file of the output "
+                           "directory as json lines.")
+  parser.add_argument("--replay-trace", action="store", default=None, dest="replay_trace",
+                      help="Trace written by --record-trace that is replayed by the replay test.")
+  parser.add_argument("--replay-speed", action="store", default=1.0, dest="replay_speed",
+                      type=float, help="Speed of the replay, 2 replays the trace twice as fast "
+                                       "and 0 as fast as possible.")
+  parser.add_argument("--soak-duration", action="store", default=None, dest="soak_duration",
+                      type=float, help="Run only the soak test, keeping the load for this "
+                                       "number of seconds.")
+  parser.add_argument("--soak-rate", action="store", default=100, dest="soak_rate", type=float,
+                      help="Requests per second sent during the soak test.")
+  parser.add_argument("--soak-window", action="store", default=60, dest="soak_window",
+                      type=float, help="Seconds of every window of metrics of the soak test.")
+  parser.add_argument("--soak-degradation", action="store", default=0.5,
+                      dest="soak_degradation", type=float,
+                      help="Relative growth of the p99 along the soak test that fails it.")
+  parser.add_argument("--soak-error-rate-growth", action="store", default=0.01,
+                      dest="soak_error_rate_growth", type=float,
+                      help="Absolute growth of the error rate along the soak test that fails it.")
+  parser.add_argument("--capacity-slo", action="store", default=None, dest="capacity_slo",
+                      type=float, help="Run only the capacity search, the load grows until "
+                                       "the latency percentile goes over these seconds.")
+  parser.add_argument("--capacity-percentile", action="store", default=99,
+                      dest="capacity_percentile", type=float,
+                      help="Percentile of the latency checked against the SLO.")
+  parser.add_argument("--capacity-error-rate", action="store", default=0.01,
+                      dest="capacity_error_rate", type=float,
+                      help="Fraction of failed requests that ends the capacity search.")
+  parser.add_argument("--capacity-mode", action="store", default="rate", dest="capacity_mode",
+                      choices=("rate", "concurrency"),
+                      help="Search the highest request rate (open loop) or concurrency.")
+  parser.add_argument("--capacity-search", action="store", default="binary",
+                      dest="capacity_search", choices=capacity.SEARCHES,
+                      help="Only ramp the load (step) or narrow the limit down (binary).")
+  parser.add_argument("--capacity-start", action="store", default=10, dest="capacity_start",
+                      type=int, help="Load of the first step of the capacity search.")
+  parser.add_argument("--capacity-limit", action="store", default=10000,
+                      dest="capacity_limit", type=int,
+                      help="Highest load tried by the capacity search.")
+  parser.add_argument("--capacity-step-duration", action="store", default=10,
+                      dest="capacity_step_duration", type=float,
+                      help="Seconds every step of the capacity search lasts.")
+  parser.add_argument("--capacity-endpoints", action="store",
+                      default="create_game,get_game,claim", dest="capacity_endpoints",
+                      type=lambda value: value.split(","),
+                      help="Comma separated endpoints searched: create_game, get_game, claim.")
+  parser.add_argument("--list-page-size", action="store", default=None, dest="list_page_size",
+                      type=int, help="Games requested at once when the tests list the games, "
+                                     "the listing is never paged by default.")
+  parser.add_argument("--list-sizes", action="store", default=None, dest="list_sizes",
+                      type=lambda value: [int(size) for size in value.split(",")],
+                      help="Run only the listing benchmark, games are created until the "
+                           "server stores each of these comma separated numbers and the "
+                           "latency and memory of listing them are written to listing.json.")
+  parser.add_argument("--matrix-concurrency", action="store", default=None,
+                      dest="matrix_concurrency",
+                      type=lambda value: [int(level) for level in value.split(",")],
+                      help="Run only the scaling matrix with these comma separated "
+                           "concurrency levels, e.g. 1,10,100,1000. Every cell is written to "
+                           "matrix.csv and the curves by concurrency to matrix.json.")
+  parser.add_argument("--matrix-keep-alive", action="store", default="on,off",
+                      dest="matrix_keep_alive", type=matrix.parse_keep_alive,
+                      help="Keep-alive settings of the scaling matrix: on, off or on,off.")
+  parser.add_argument("--matrix-sizes", action="store", default="2x5,5x5,10x5",
+                      dest="matrix_sizes", type=matrix.parse_sizes,
+                      help="Comma separated game sizes of the scaling matrix as "
+                           "<numPlayers>x<numDice>.")
+  parser.add_argument("--matrix-endpoints", action="store", default="create_game,get_game",
+                      dest="matrix_endpoints", type=lambda value: value.split(","),
+                      help="Comma separated endpoints of the scaling matrix: "
+                           "%s." % ", ".join(matrix.ENDPOINTS))
+  parser.add_argument("--matrix-duration", action="store", default=10, dest="matrix_duration",
+                      type=float, help="Seconds every cell of the scaling matrix lasts.")
+  parser.add_argument("--matrix-error-rate", action="store", default=0.01,
+                      dest="matrix_error_rate", type=float,
+                      help="Fraction of failed requests allowed in a cell of the scaling "
+                           "matrix.")
+  parser.add_argument("--server-pid", action="store", default=None, dest="server_pid",
+                      type=int, help="Sample the CPU, memory, file descriptors and sockets of "
+                                     "this local server process during the run.")
+  parser.add_argument("--sample-resources", action="store_true", default=False,
+                      dest="sample_resources",
+                      help="Sample the resources of the server started by --local-server.")
+  parser.add_argument("--resource-interval", action="store", default=1.0,
+                      dest="resource_interval", type=float,
+                      help="Seconds between the samples of the server resources, the client "
+                           "latency is reported in windows of the same length.")
+  parser.add_argument("--baseline", action="store", default=None, dest="baseline",
+                      help="benchmark.json of a previous run, the run fails if the load "
+                           "scenarios regressed beyond the tolerances.")
+  parser.add_argument("--latency-tolerance", action="store", default=0.2,
+                      dest="latency_tolerance", type=float,
+                      help="Relative increase of the mean, p50 and p99 latencies allowed "
+                           "against the baseline.")
+  parser.add_argument("--throughput-tolerance", action="store", default=0.2,
+                      dest="throughput_tolerance", type=float,
+                      help="Relative decrease of the throughput allowed against the baseline.")
+  parser.add_argument("--error-rate-tolerance", action="store", default=0.01,
+                      dest="error_rate_tolerance", type=float,
+                      help="Absolute increase of the error rate allowed against the baseline.")
+  parser.add_argument("--workers", action="store", default=1, dest="workers", type=int,
+                      help="Run the concurrency tests in this number of processes and merge "
+                           "their results.")
+  parser.add_argument("--parallel", action="store", default=1, dest="parallel", type=int,
+                      help="Distribute the tests between this number of processes.")
   args = vars(parser.parse_args())
+  if not args["server_url"] and not args["local_server"]:
+    parser.error("--server-url or --local-server is required.")
+  if args["workers"] > 1 and args["parallel"] > 1:
+    parser.error("--workers and --parallel can't be used together.")
+  if args["request_timings"] and args["transport"] != "requests":
+    parser.error("--request-timings needs the requests transport.")
+  if args["sample_resources"] and not args["local_server"] and not args["server_pid"]:
+    parser.error("--sample-resources needs --local-server, use --server-pid otherwise.")
+  if args["local_server_workers"] < 1:
+    parser.error("--local-server-workers must be at least 1.")
+  if args["game_pool_size"] < 1:
+    parser.error("--game-pool-size must be at least 1.")
+  modes = [(option, tests) for dest, option, tests in MODES if args[dest]]
+  if len(modes) > 1:
+    parser.error("Only one of %s can be used at once." % ", ".join(
+      option for option, _ in modes))
+  if modes and args["nose_args"]:
+    parser.error("%s runs its own tests, it can't be used with --nose-args." % modes[0][0])
+  logging.basicConfig(level=logging.INFO)
+  # Every new connection is logged by urllib3 as INFO
+  logging.getLogger("requests").setLevel(logging.WARNING)
+  make_directory(args["output_directory"])
+  workers = args.pop("workers")
+  parallel = args.pop("parallel")
+  baseline = args.pop("baseline")
+  tolerances = dict((key, args.pop(key)) for key in ("latency_tolerance",
+                                                     "throughput_tolerance",
+                                                     "error_rate_tolerance"))
+  if modes:
+    args["nose_args"] = [modes[0][1]]
+  server = None
+  local_server_workers = args.pop("local_server_workers")
+  if args.pop("local_server"):
+    server = start_local_server(args["server_port"], local_server_workers)
+    args["server_url"] = "http://localhost"
+    if args["sample_resources"] and not args["server_pid"]:
+      args["server_pid"] = server.pid
+  args.pop("sample_resources")
   try:
-    os.mkdir(args["output_directory"])
-  except OSError as e:
-    if e.errno != errno.EEXIST:
-        raise e
-    pass
-  if run_tests(**args):
+    if workers > 1:
+      success = run_workers(workers, **args)
+    elif parallel > 1:
+      success = run_parallel(parallel, **args)
+    else:
+      success = run_tests(**args)
+  finally:
+    if server is not None:
+      server.terminate()
+      server.wait()
+  if not check_benchmark(args["output_directory"], baseline, **tolerances):
+    success = False
+  if success:
     sys.exit(0)
   sys.exit(1)
@@ -1,13 +1,34 @@
 import requests
+import errno
+import itertools
 import logging
+import os
 import json
+import random
+import re
+import threading
+import time
 from nose.exc import SkipTest
 from urlparse import urlparse, urljoin
 import collections
 from nose.tools import assert_equals, assert_true
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from utils import benchmark, cache, responses, timing, trace
+from utils.load import LoadDriver
+from utils.transport import RawTransport, RequestsTransport
 
 LOG = logging.getLogger(__name__)
 
+# Every thread keeps its own session so the connections are never shared between threads
+_thread_local = threading.local()
+# Games created in bulk for the tests that only need a game nobody has played yet,
+# keyed by (connection_string, numPlayers, numDice)
+_game_pool = collections.defaultdict(collections.deque)
+_game_pool_lock = threading.Lock()
+# Numbers the files of the failures dumped
+_failure_count = itertools.count()
+
 class LiarDiceTestBase(object):
   # This is a test object
   __test__ = True
@@ -16,6 +37,81 @@ class LiarDiceTestBase(object):
   server_url = "http://localhost"
   server_port = 8080
   secure_connection = True
+  # Connection pool used by the session of each thread
+  pool_size = 10
+  keep_alive = True
+  max_retries = 0
+  retry_backoff = 0
+  # Backend of the HTTP calls, see utils.transport.TRANSPORTS
+  transport = "requests"
+  # Calls made with every transport by the transport benchmark, it only runs when given
+  transport_benchmark = None
+  pipeline_depth = 10
+  # Load generated by the concurrency tests
+  load_concurrency = 20
+  load_rate = None
+  load_requests = 10000
+  # Open loop test, it only runs when an arrival rate is given
+  arrival_rate = None
+  arrival_rate_end = None
+  arrival_duration = 60
+  max_in_flight = 1000
+  # Check that the games created by the load tests exist, are unique and are listed
+  verify_games = True
+  # Whole games played at the same time by the gameplay test
+  gameplay_games = 50
+  # Reads of the game state after every action of the gameplay tests
+  gameplay_polls = 1
+  # Games created at once when the pool of pristine games is empty
+  game_pool_size = 25
+  # Record the time spent in every phase of the requests
+  request_timings = False
+  # Json module used to parse the responses, see utils.responses.DECODERS
+  json_decoder = "auto"
+  # Fraction of the responses whose schema gets validated
+  validation_sample = 1.0
+  # Check the types of the fields of the responses besides their keys
+  strict_schemas = False
+  # Characters of the response content shown when an assertion fails
+  failure_body_limit = 2000
+  # Write the failed requests and responses to the failures directory of the output
+  dump_failures = False
+  # Random payloads added to the fuzz corpora, None skips the fuzz tests
+  fuzz_combinations = None
+  # Soak test, it only runs when a duration is given
+  soak_duration = None
+  soak_rate = 100
+  soak_window = 60
+  soak_degradation = 0.5
+  soak_error_rate_growth = 0.01
+  # Capacity search, it only runs when a latency SLO is given
+  capacity_slo = None
+  capacity_percentile = 99
+  capacity_error_rate = 0.01
+  capacity_mode = "rate"
+  capacity_search = "binary"
+  capacity_start = 10
+  capacity_limit = 10000
+  capacity_step_duration = 10
+  capacity_endpoints = ("create_game", "get_game", "claim")
+  # Games requested at once when listing them, None lists every game with a single request
+  list_page_size = None
+  # Number of stored games at which the listing benchmark measures, it only runs when given
+  list_sizes = None
+  # Scaling matrix, it only runs when concurrency levels are given
+  matrix_concurrency = None
+  matrix_keep_alive = (True, False)
+  matrix_sizes = ((2, 5), (5, 5), (10, 5))
+  matrix_endpoints = ("create_game", "get_game")
+  matrix_duration = 10
+  matrix_error_rate = 0.01
+  # Directory of the xunit file, the tests can write their reports in it
+  output_directory = None
+  # Trace replayed by the replay test
+  replay_trace = None
+  replay_speed = 1.0
+  # Queue of the parent process when the tests run in several workers
+  results_queue = None
 
   def __init__(self, *args, **kwargs):
     super(LiarDiceTestBase, self).__init__(*args, **kwargs)
@@ -48,14 +144,82 @@ class LiarDiceTestBase(object):
     """
     return self.post("games", **kwargs)
 
+  def new_games(self, players, dice, count):
+    """
+    Create games concurrently
+    :param players: Number of players
+    :param dice: Number of dice
+    :param count: Number of games
+    :return: list with the json body of every game
+    """
+    def create():
+      r = self.new_game(data={"numPlayers": players, "numDice": dice})
+      json_body = self.assert_OK(r)
+      self.assert_game_response_keys(json_body)
+      return json_body
+    result = self.run_concurrently((create for _ in xrange(count)),
+                                   concurrency=min(self.load_concurrency, count))
+    if result.errors:
+      raise result.errors[0]
+    return result.results
+
+  def run_concurrently(self, tasks, concurrency=None, rate=None):
+    """
+    Execute tasks from several threads. Every thread keeps the results, errors and times of
+    its tasks in a buffer of its own and the buffers are merged when all the threads end, so
+    the threads share nothing but the tasks while the requests are measured.
+    :param tasks: iterable of callables, e.g. the helpers of this class wrapped in a lambda
+    :param concurrency: number of threads, load_concurrency by default
+    :param rate: requests per second, None to go as fast as possible
+    :return: utils.load.LoadResult
+    """
+    driver = LoadDriver(concurrency=concurrency or self.load_concurrency, rate=rate)
+    return driver.run(tasks)
+
+  def pristine_game(self, players=5, dice=5):
+    """
+    Get a game in which no action has been made. Games are taken from a pool that gets
+    filled with game_pool_size games at once, so the tests that only need a new game
+    don't pay a round trip each.
+    :param players: Number of players
+    :param dice: Number of dice
+    :return: json body of the new game response
+    """
+    key = (self.connection_string, players, dice)
+    with _game_pool_lock:
+      if _game_pool[key]:
+        return _game_pool[key].popleft()
+    # The pool is filled without the lock so the other threads don't wait for the round trips,
+    # a thread that finds it empty meanwhile fills it too
+    games = self.new_games(players, dice, max(1, self.game_pool_size))
+    with _game_pool_lock:
+      _game_pool[key].extend(games[1:])
+    return games[0]
+
   def get_game(self, id, **kwargs):
     """
     Get a game by id
     :param id: game id
     :param kwargs: extra arguments for requests
-    :return: requests.Response object
+    :return: requests.Response object, the cached one when utils.cache.CACHE is enabled and
+    the game didn't change
     """
-    return self.get("games/{0}".format(id), **kwargs)
+    game_cache = cache.CACHE
+    if game_cache is None:
+      return self.get("games/{0}".format(id), **kwargs)
+    cached, etag, generation = game_cache.lookup(id)
+    if cached is not None and etag is None:
+      game_cache.count("hits")
+      return cached
+    if etag is not None:
+      kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"If-None-Match": etag})
+    r = self.get("games/{0}".format(id), **kwargs)
+    if r.status_code == 304 and cached is not None:
+      game_cache.count("revalidated")
+      return cached
+    game_cache.count("misses")
+    game_cache.store(id, r, generation)
+    return r
 
   def list_games(self, **kwargs):
     """
@@ -65,6 +229,45 @@ class LiarDiceTestBase(object):
     """
     return self.get("games", **kwargs)
 
+  def iter_games(self, page_size=None, chunk_size=64 * 1024):
+    """
+    List the games lazily: the body is parsed as it arrives, so the whole list is never kept
+    in memory, and with a page size the games are requested in pages with the skip and limit
+    arguments. A server that ignores them answers every game in the first page.
+    :param page_size: games requested at once, None to request all of them at once
+    :param chunk_size: bytes read from the connection at once
+    :return: generator of the games
+    :raises ValueError if a body isn't a json array
+    """
+    skip = 0
+    first_id = None
+    while True:
+      params = {"skip": skip, "limit": page_size} if page_size else None
+      r = self.list_games(params=params, stream=True)
+      if r.status_code != 200:
+        self.assert_OK(r)
+      count = 0
+      complete = False
+      try:
+        for game in responses.iter_array(r.iter_content(chunk_size)):
+          if count == 0 and skip:
+            # The skip argument was ignored, the first page again
+            if isinstance(game, dict) and game.get("_id") == first_id:
+              break
+          elif count == 0:
+            first_id = game.get("_id") if isinstance(game, dict) else None
+          count += 1
+          yield game
+        else:
+          complete = True
+      finally:
+        if not complete:
+          # Closes the connection, the rest of the body isn't read
+          r.close()
+      if not page_size or count != page_size:
+        return
+      skip += count
+
   def claim(self, id, **kwargs):
     """
     Make a claim
@@ -72,7 +275,10 @@ class LiarDiceTestBase(object):
     :param kwargs: extra arguments for requests
     :return: requests.Response object
     """
-    return self.post("games/{0}/claim".format(id), **kwargs)
+    r = self.post("games/{0}/claim".format(id), **kwargs)
+    if cache.CACHE is not None:
+      cache.CACHE.invalidate(id)
+    return r
 
   def challenge(self, id, **kwargs):
     """
@@ -81,11 +287,52 @@ class LiarDiceTestBase(object):
     :param kwargs: extra arguments for requests
     :return: requests.Response object
     """
-    return self.post("games/{0}/challenge".format(id), **kwargs)
+    r = self.post("games/{0}/challenge".format(id), **kwargs)
+    if cache.CACHE is not None:
+      cache.CACHE.invalidate(id)
+    return r
 
   """
   All the methods use the requests library and the results will be analized as such
   """
+  @classmethod
+  def session(cls):
+    """
+    Get the session of the current thread, it is created on first use with a connection
+    pool of pool_size connections so the TCP (and TLS) handshake is done only once.
+    :return: requests.Session object
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+      session = requests.Session()
+      adapter_class = timing.TimedHTTPAdapter if cls.request_timings else HTTPAdapter
+      adapter = adapter_class(pool_connections=cls.pool_size,
+                              pool_maxsize=cls.pool_size,
+                              max_retries=Retry(total=cls.max_retries,
+                                                backoff_factor=cls.retry_backoff))
+      session.mount("http://", adapter)
+      session.mount("https://", adapter)
+      if not cls.keep_alive:
+        session.headers["Connection"] = "close"
+      _thread_local.session = session
+    return session
+
+  @classmethod
+  def get_transport(cls):
+    """
+    Get the transport of the current thread, the requests one uses the session of the thread.
+    :return: utils.transport.Transport object
+    """
+    client = getattr(_thread_local, "transport", None)
+    if client is None:
+      if cls.transport == "raw":
+        client = RawTransport(pool_size=cls.pool_size, keep_alive=cls.keep_alive,
+                              max_retries=cls.max_retries, retry_backoff=cls.retry_backoff)
+      else:
+        client = RequestsTransport(cls.session())
+      _thread_local.transport = client
+    return client
+
   def put(self, endpoint, **kwargs):
     """
     Make a put call.
@@ -93,10 +340,7 @@ class LiarDiceTestBase(object):
     :param kwargs: extra arguments for requests
     :return: requests.Response object
     """
-    url = urljoin(self.connection_string, endpoint)
-    LOG.debug("PUT %s DATA: %s" % (url, json.dumps(kwargs["data"]) if "data" in kwargs else "",))
-    return requests.put(url,
-                        verify=self.secure_connection, **kwargs)
+    return self.request("PUT", endpoint, **kwargs)
 
   def get(self, endpoint, **kwargs):
     """
@@ -105,10 +349,7 @@ class LiarDiceTestBase(object):
     :param kwargs: extra arguments for requests
     :return: requests.Response object
     """
-    url = urljoin(self.connection_string, endpoint)
-    LOG.debug("GET %s DATA: %s" % (url, json.dumps(kwargs["data"]) if "data" in kwargs else "",))
-    return requests.get(url,
-                        verify=self.secure_connection, **kwargs)
+    return self.request("GET", endpoint, **kwargs)
 
   def post(self, endpoint, **kwargs):
     """
@@ -117,10 +358,38 @@ class LiarDiceTestBase(object):
     :param kwargs: extra arguments for requests
     :return: requests.Response object
     """
+    return self.request("POST", endpoint, **kwargs)
+
+  def request(self, method, endpoint, **kwargs):
+    """
+    Make a call with the transport of the current thread, when request_timings is enabled
+    the call goes through the session and its phases are recorded by endpoint in
+    utils.timing.RECORDER, when a trace is being recorded the call is written to
+    utils.trace.RECORDER and when a timeline is being recorded the call is added to
+    utils.benchmark.TIMELINE.
+    :param method: http method
+    :param endpoint: endpoint we are going to make the call to.
+    :param kwargs: extra arguments for requests
+    :return: requests.Response object, or one with the same attributes
+    """
     url = urljoin(self.connection_string, endpoint)
-    LOG.debug("POST %s DATA: %s" % (url, json.dumps(kwargs["data"]) if "data" in kwargs else "",))
-    return requests.post(url,
-                         verify=self.secure_connection, **kwargs)
+    LOG.debug("%s %s DATA: %s" % (method, url,
+                                  json.dumps(kwargs["data"]) if "data" in kwargs else "",))
+    start = time.time()
+    if not self.request_timings:
+      r = self.get_transport().request(method, url, verify=self.secure_connection, **kwargs)
+    else:
+      name = timing.endpoint_name(endpoint)
+      timing.reset_connection_phases()
+      r = self.session().request(method, url, verify=self.secure_connection, **kwargs)
+      timing.RECORDER.record_request(name, time.time() - start, r.elapsed)
+      # Used to record the time spent decoding the body
+      r.endpoint_name = name
+    if benchmark.TIMELINE is not None:
+      benchmark.TIMELINE.record(start, time.time() - start, r.status_code >= 500)
+    if trace.RECORDER is not None:
+      trace.RECORDER.record(method, endpoint, kwargs, r)
+    return r
 
   @classmethod
   def site_available(cls):
@@ -129,7 +398,9 @@ class LiarDiceTestBase(object):
     :return: True if the site is available
     """
     try:
-      requests.get(cls.connection_string).raise_for_status()
+      r = cls.session().get(cls.connection_string)
+      r.raise_for_status()
+      benchmark.REPORT.server_version = r.headers.get("server")
       return True
     except requests.exceptions.HTTPError as e:
       LOG.error(e)
@@ -141,10 +412,16 @@ class LiarDiceTestBase(object):
     :param r: requests.Response
     :raises ValueError if the response doesn't have a valid json object
     """
+    decoder = responses.get_decoder(self.json_decoder)
     try:
-      return r.json()
+      if not self.request_timings or not hasattr(r, "endpoint_name"):
+        return responses.decode(r, decoder)
+      start = time.time()
+      json_response = responses.decode(r, decoder)
+      timing.RECORDER.record(r.endpoint_name, "json", time.time() - start)
+      return json_response
     except ValueError as v:
-      raise ValueError("Invalid text found in response: %s" % self.format_response(r))
+      raise ValueError("Invalid text found in response: %s" % self.describe_failure(r))
 
   def assert_ERROR(self, r, message=""):
     """
@@ -157,7 +434,7 @@ class LiarDiceTestBase(object):
     # Look for an error in the body message or the http code of user/server error
     if (isinstance(json_response, collections.Iterable) and "error" not in json_response) \
         or (r.status_code >= 400  and r.status_code < 600):
-      assert_true(False, self.format_response(r))
+      assert_true(False, self.describe_failure(r, message))
     return json_response
 
   def assert_OK(self, r, message=""):
@@ -168,15 +445,61 @@ class LiarDiceTestBase(object):
     :return: json object with the json response already validated (a valid json object)
     """
     json_response = self.__get_json_or_raise(r)
-    assert_equals(r.status_code, 200, "{0}\n{1}".format(message,self.format_response(r)))
+    # The description of the response is only built when the assertion fails
+    if r.status_code != 200:
+      assert_equals(r.status_code, 200, self.describe_failure(r, message))
     return json_response
 
-  def format_response(self, r):
+  def describe_failure(self, r, message=""):
+    """
+    Describe a response that failed an assertion, the whole request and response are written
+    to the failures directory when dump_failures is set.
+    :param r: requests.Response object
+    :param message: Extra message prepended to the description
+    :return: description capped to failure_body_limit characters of content
+    """
+    description = self.format_response(r, self.failure_body_limit)
+    if self.dump_failures and self.output_directory:
+      path = self.dump_response(r)
+      description += "\n    Dumped to: %s" % path
+    return "{0}\n{1}".format(message, description) if message else description
+
+  def dump_response(self, r):
+    """
+    Write a request and its response to a file of the failures directory.
+    :param r: requests.Response object
+    :return: path of the file
+    """
+    directory = os.path.join(self.output_directory, "failures")
+    try:
+      os.mkdir(directory)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise e
+    request = r.request
+    name = re.sub(r"\W+", "_", timing.endpoint_name(urlparse(request.url).path)).strip("_")
+    path = os.path.join(directory, "%06d-%s-%s.txt" % (next(_failure_count), request.method,
+                                                        name or "root"))
+    with open(path, "wb") as f:
+      f.write("{0} {1}\n".format(request.method, request.url))
+      f.write("".join("{0}: {1}\n".format(k, v) for k, v in request.headers.items()))
+      f.write("\n{0}\n\n".format(request.body or ""))
+      f.write("{0} {1}\n".format(r.status_code, r.reason))
+      f.write("".join("{0}: {1}\n".format(k, v) for k, v in r.headers.items()))
+      f.write("\n")
+      f.write(r.content)
+    return path
+
+  def format_response(self, r, limit=None):
     """
     Format data for debug purposes
     :param r: requests.Response object
+    :param limit: maximum number of characters of the content, None for all of it
     :return:
     """
+    content = r.text
+    if limit is not None and len(content) > limit:
+      content = u"{0}... ({1} more characters)".format(content[:limit], len(content) - limit)
     return """
     Status Code: {0}
     Method: {1}
@@ -194,13 +517,42 @@ class LiarDiceTestBase(object):
                               r.headers,
                               r.url,
                               r.encoding,
-                              r.text,
-                              "\n".join(r.history),
+                              content,
+                              "\n".join("{0} {1}".format(h.status_code, h.url)
+                                        for h in r.history),
                               r.reason,
                               r.elapsed)
 
+  def report_scenario(self, name, latencies, operations, errors, duration):
+    """
+    Add the result of a load scenario to the benchmark report, when the tests run in a
+    worker the result is sent to the parent process too.
+    :param name: name of the scenario
+    :param latencies: utils.histogram.LatencyHistogram of the operations
+    :param operations: number of operations, including the ones that failed
+    :param errors: number of operations that failed
+    :param duration: seconds
+    """
+    benchmark.REPORT.add(name, latencies, operations, errors, duration)
+    if self.results_queue is not None:
+      self.results_queue.put(("scenario", name, {
+        "latencies": latencies.to_dict(),
+        "operations": operations,
+        "errors": errors,
+        "duration": duration,
+        "server_version": benchmark.REPORT.server_version,
+      }))
+
   def assert_game_response_keys(self, response):
-    keys = ("numDice", "numPlayers", "board", "actions", "playerHands", "_id")
-    for key in keys:
-      if key not in response:
-        raise ValueError("Key '%s' wasn't avaialble in New Game Response." % key)
\ No newline at end of file
+    self.assert_response_schema(responses.GAME, response)
+
+  def assert_response_schema(self, schema, response):
+    """
+    Validate a response with a schema, only a validation_sample fraction of the responses
+    are validated so the load tests can skip most of the work.
+    :param schema: utils.responses.Schema, e.g. GAME, CLAIM or CHALLENGE
+    :param response: json body of the response
+    :raises ValueError if the response doesn't follow the schema
+    """
+    if self.validation_sample >= 1 or random.random() < self.validation_sample:
+      schema.validate(response, strict=self.strict_schemas)
\ No newline at end of file
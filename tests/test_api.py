@@ -1,7 +1,9 @@
+import itertools
 import logging
 import sys
 
 from nose.tools import assert_equals, assert_true, assert_false
+from utils import cache, fuzz
 from utils.generators import random_string
 from nose.exc import SkipTest
 from ldtest import LiarDiceTestBase
@@ -15,12 +17,12 @@ class ApiTest(LiarDiceTestBase):
     Verify that listing the games returns an actual list
     :return:
     """
-    r = self.list_games()
-    self.assert_OK(r)
     try:
-      r.json()
+      for game in self.iter_games(self.list_page_size):
+        assert_true(isinstance(game, dict), "The game list has an item that isn't a game: %r"
+                    % (game, ))
     except ValueError as e:
-      assert_true(False, " A json object wasn't returned when asking for the game list.")
+      assert_true(False, " A json list wasn't returned when asking for the game list: %s" % e)
 
   def test_invalid_game_ids(self):
     """
@@ -42,9 +44,10 @@ class ApiTest(LiarDiceTestBase):
         at processImmediate [as _immediateCallback] (timers.js:368:17)
 
     """
-    for id_length in xrange(1, 1500):
-      r = self.get_game(random_string(id_length))
-      self.assert_ERROR(r)
+    engine = fuzz.FuzzEngine(self.get_game, fuzz.error_expected,
+                             concurrency=self.load_concurrency)
+    result = engine.run(("game id %s" % fuzz.describe(id), id) for id in fuzz.ids())
+    assert_false(result.problems(), "Invalid game ids weren't rejected.\n%s" % result.report())
 
   def test_number_of_dice_max_int(self):
     """
@@ -97,9 +100,7 @@ class ApiTest(LiarDiceTestBase):
         at /home/mario/Repos/liars-dice-front-end/node_modules/nedb/lib/executor.js:40:13
         at Immediate.q.process [as _onImmediate] (/home/mario/Repos/liars-dice-front-end/node_modules/async/lib/async.js:731:21)
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     # make an empty claim
     r = self.claim(json_body["_id"], data={})
     self.assert_ERROR(r)
@@ -166,13 +167,46 @@ class ApiTest(LiarDiceTestBase):
     r = self.new_game(data=data)
     self.assert_ERROR(r)
 
+  def test_fuzz_games(self):
+    """
+    Send a corpus of game payloads with wrong types, boundaries and oversized values, as form
+    data and as json. The server must answer all of them.
+    """
+    if self.fuzz_combinations is None:
+      raise SkipTest("Fuzzing wasn't requested.")
+    self.execute_fuzz(fuzz.GAME_FIELDS, self.new_game)
+
+  def test_fuzz_claims(self):
+    """
+    Send a corpus of claim payloads to a few games, the server must answer all of them.
+    """
+    if self.fuzz_combinations is None:
+      raise SkipTest("Fuzzing wasn't requested.")
+    games = itertools.cycle([game["_id"] for game in
+                             self.new_games(5, 5, self.game_pool_size)])
+    self.execute_fuzz(fuzz.CLAIM_FIELDS, lambda **kwargs: self.claim(next(games), **kwargs))
+
+  def execute_fuzz(self, fields, send):
+    """
+    Fuzz an endpoint and fail with one example of every kind of failure found.
+    :param fields: dict with a valid value of every field of the payload
+    :param send: callable(**kwargs) that makes the request, e.g. self.new_game
+    """
+    corpus = fuzz.payloads(fields, fuzz.values(), combinations=self.fuzz_combinations)
+    problems = list()
+    for encoding in ("data", "json"):
+      engine = fuzz.FuzzEngine(lambda payload: send(**{encoding: payload}), fuzz.server_failure,
+                               concurrency=self.load_concurrency)
+      result = engine.run(corpus)
+      if result.problems():
+        problems.append("Sent as %s:\n%s" % (encoding, result.report()))
+    assert_false(problems, "\n".join(problems))
+
   def test_do_valid_claim(self):
     """
     Test if a valid game works as expected.
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     player_0_any_die_face = list(set(json_body["playerHands"][0]))[0]
     r = self.claim(json_body["_id"], data={
       "player": 0,
@@ -214,9 +248,7 @@ class ApiTest(LiarDiceTestBase):
     This method executes all the combinations created by the valid claims generator
     :param data: json body sent to the server to do the claim
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     # Retrieve a valid face
     if "moveFace" in data and data["moveFace"] == "compute":
       data["moveFace"] = list(set(json_body["playerHands"][0]))[0]
@@ -328,9 +360,7 @@ class ApiTest(LiarDiceTestBase):
     This method executes all the combinations created by the invalid claims generator.
     :param data: json body sent to the server to do the claim
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     # Retrieve a valid face
     if "moveFace" in data and data["moveFace"] == "compute":
       data["moveFace"] = list(set(json_body["playerHands"][0]))[0]
@@ -347,9 +377,7 @@ class ApiTest(LiarDiceTestBase):
     Verify if every time we move a die or dice to the center our dice get re-rolled as
     stated in the game description.
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     id = json_body["_id"]
     # Player 0 hand
     before_list = json_body["playerHands"][0][1:]
@@ -374,13 +402,37 @@ class ApiTest(LiarDiceTestBase):
     assert_false(same_list, "Dice didn't get re-rolled when moving to the center.")
 
 
+  def test_cached_game_polling(self):
+    """
+    Read a game several times through the game cache, a claim must invalidate it so the
+    next read shows the claim.
+    """
+    previous_cache, cache.CACHE = cache.CACHE, cache.GameCache(10)
+    try:
+      json_body = self.pristine_game()
+      id = json_body["_id"]
+      for _ in xrange(3):
+        self.assert_game_response_keys(self.assert_OK(self.get_game(id)))
+      r = self.claim(id, data={
+        "player": 0,
+        "claimNumber": 1,
+        "claimFace": json_body["playerHands"][0][0],
+      })
+      self.assert_OK(r)
+      json_body = self.assert_OK(self.get_game(id))
+      report = cache.CACHE.report()
+    finally:
+      cache.CACHE = previous_cache
+    assert_equals(len(json_body["actions"]), 1, "The cache returned the game before the claim.")
+    assert_equals(report["misses"], 2)
+    assert_equals(report["hits"] + report["revalidated"], 2)
+    assert_equals(report["invalidations"], 1)
+
   def test_claim_twice(self):
     """
     We assume that only a claim can be done per turn
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     player_0_any_die_face = list(set(json_body["playerHands"][0]))[0]
     r = self.claim(json_body["_id"], data={
       "player": 0,
@@ -419,9 +471,7 @@ class ApiTest(LiarDiceTestBase):
     """
     Try to do a challenge before doing an actual claim. This should error out.
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     r = self.challenge(json_body["_id"], data={"player": 1})
     self.assert_ERROR(r)
 
@@ -430,9 +480,7 @@ class ApiTest(LiarDiceTestBase):
     Check if the challenge response is correct by counting number of die in the game
     and doing a good claim and an erroneous claim.
     """
-    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-    json_body = self.assert_OK(r)
-    self.assert_game_response_keys(json_body)
+    json_body = self.pristine_game()
     id = json_body["_id"]
     all_hands = list()
     for hand in json_body["playerHands"]:
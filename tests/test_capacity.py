@@ -0,0 +1,116 @@
+import collections
+import itertools
+import json
+import logging
+import os
+import time
+
+from nose.exc import SkipTest
+from nose.tools import assert_true
+from ldtest import LiarDiceTestBase
+from utils import generators
+from utils.capacity import CapacitySearch
+from utils.load import OpenLoopScheduler, constant_arrivals
+
+LOG = logging.getLogger(__name__)
+
+# Increasing bids of a game of 5 players with 5 dice, (number, face)
+CLAIM_BIDS = list(itertools.product(xrange(1, 26), xrange(1, 7)))
+
+class CapacityTest(LiarDiceTestBase):
+
+  def test_capacity(self):
+    """
+    Search the highest request rate (or concurrency) every endpoint sustains under the
+    latency SLO, the knee of the throughput/latency curve is reported too.
+    """
+    if not self.capacity_slo:
+      raise SkipTest("No SLO was given for the capacity search.")
+    outcomes = dict()
+    for endpoint in self.capacity_endpoints:
+      LOG.info("Searching the capacity of %s by %s" % (endpoint, self.capacity_mode))
+      self.search = CapacitySearch(lambda load: self.probe(endpoint, load),
+                                   slo=self.capacity_slo,
+                                   percentile=self.capacity_percentile,
+                                   max_error_rate=self.capacity_error_rate,
+                                   start=self.capacity_start, limit=self.capacity_limit,
+                                   search=self.capacity_search,
+                                   integer=self.capacity_mode == "concurrency")
+      outcome = outcomes[endpoint] = self.search.run()
+      outcome["mode"] = self.capacity_mode
+      LOG.info("Capacity of {0}: {1} {2} ({3} requests/s), knee at {4}".format(
+        endpoint, outcome["capacity"], self.capacity_mode, outcome["throughput"],
+        outcome["knee"]))
+    if self.output_directory:
+      with open(os.path.join(self.output_directory, "capacity.json"), "w") as f:
+        json.dump(outcomes, f, indent=2, sort_keys=True)
+    failed = [endpoint for endpoint, outcome in outcomes.items() if outcome["capacity"] is None]
+    assert_true(not failed, "The SLO isn't met even with a {0} of {1}: {2}".format(
+      self.capacity_mode, self.capacity_start, ", ".join(failed)))
+
+  def probe(self, endpoint, load):
+    """
+    Call an endpoint for capacity_step_duration seconds at the given load.
+    :return: utils.load.LoadResult
+    """
+    duration = self.capacity_step_duration
+    if self.capacity_mode == "rate":
+      tasks = self.endpoint_tasks(endpoint, int(load * duration), self.max_in_flight)
+      return OpenLoopScheduler(constant_arrivals(load, duration),
+                               max_in_flight=self.max_in_flight).run(tasks)
+    # As many calls as the previous step managed plus the growth, the first step assumes
+    # every thread makes 100 requests per second
+    previous = self.search.steps[-1]["throughput"] if self.search.steps else load * 100
+    tasks = self.endpoint_tasks(endpoint, int(previous * self.search.growth * duration), load)
+    deadline = time.time() + duration
+    return self.run_concurrently(
+      itertools.takewhile(lambda task: time.time() < deadline, tasks), concurrency=load)
+
+  def endpoint_tasks(self, endpoint, expected, in_flight):
+    """
+    :param endpoint: create_game, get_game or claim
+    :param expected: number of calls the step should make
+    :param in_flight: calls that can run at the same time
+    :return: iterable of tasks calling the endpoint
+    """
+    if endpoint == "create_game":
+      # Reused from the start if the step makes more calls than expected
+      payloads = generators.default().game_payloads(max(1, expected))
+      return (lambda payload=payload: self.assert_OK(self.new_game(data=payload))
+              for payload in itertools.cycle(payloads))
+    if endpoint == "get_game":
+      game_id = self.pristine_game()["_id"]
+      return itertools.repeat(lambda: self.assert_OK(self.get_game(game_id)))
+    if endpoint == "claim":
+      return itertools.repeat(self.claim_task(expected, in_flight))
+    raise ValueError("Unknown endpoint %s" % endpoint)
+
+  def claim_task(self, expected, in_flight):
+    """
+    Every game takes the bids from one die of face one to all its dice of face six, in turns
+    of its players, so a step creates a game every len(CLAIM_BIDS) claims rather than one per
+    claim. The games are kept in a pool, a game is used by one claim at a time and a claim
+    that finds none free creates one.
+    :param expected: number of claims the step should make
+    :param in_flight: claims that can run at the same time
+    :return: callable making a claim
+    """
+    size = min(expected, max(in_flight, -(-expected // len(CLAIM_BIDS))))
+    # [game, number of claims made]
+    pool = collections.deque([game, 0] for game in self.new_games(5, 5, size))
+
+    def claim():
+      try:
+        game = pool.popleft()
+      except IndexError:
+        game = [self.assert_OK(self.new_game(data={"numPlayers": 5, "numDice": 5})), 0]
+      number, face = CLAIM_BIDS[game[1]]
+      self.assert_OK(self.claim(game[0]["_id"], data={
+        "player": game[1] % 5,
+        "claimNumber": number,
+        "claimFace": face,
+      }))
+      game[1] += 1
+      if game[1] < len(CLAIM_BIDS):
+        pool.append(game)
+    return claim
@@ -1,10 +1,16 @@
+import collections
+import functools
+import itertools
 import logging
 import sys
-import threading
 
+from nose.exc import SkipTest
 from nose.tools import assert_true, assert_false
 from ldtest import LiarDiceTestBase
-import datetime
+from utils import generators
+from utils.histogram import LatencyHistogram
+from utils.load import OpenLoopScheduler, constant_arrivals, ramp_arrivals
+from utils.verify import GameVerifier
 
 LOG = logging.getLogger(__name__)
 
@@ -15,49 +21,98 @@ class ApiTest(LiarDiceTestBase):
     Test the API to see if there's any error with concurrent game creation and
     verify that the performance is optimal
     """
-    # Available only for this test
-    # Nose is very explicit when it says that every tests is independent
-    self.game_ids = list()
-    self.errors = list()
-    self.response_times = list()
-    threads = list()
-    for i in range(20):
-      t = threading.Thread(target=self.create_games, kwargs={"N": 500})
-      threads.append(t)
-      t.start()
-
-    for thread in threads:
-      thread.join()
-    avg_response_time = sum(self.response_times, datetime.timedelta(0)) / len(self.response_times)
-
-    LOG.info("Average response: {0}".format(avg_response_time))
+    payloads = generators.default().game_payloads(self.load_requests)
+    result = self.run_concurrently(
+      (functools.partial(self.create_game, payload) for payload in payloads), rate=self.load_rate)
+    # The times of the server responses are only gathered once all the threads ended
+    self.latencies = LatencyHistogram()
+    for _, elapsed in result.results:
+      self.latencies.record(elapsed)
+    self.game_ids = [game_id for game_id, _ in result.results]
+    self.errors = [e.message for e in result.errors]
+    self.report_scenario("create_games", self.latencies, self.load_requests, len(self.errors),
+                         result.duration)
+
+    LOG.info("Throughput: {0:.2f} requests/s".format(result.throughput))
     if len(self.errors):
       assert_true(False, "Errors occurred while executing concurrent game creation.\n%s"
                   % "\n".join(self.errors)
                   )
+    if self.verify_games:
+      verification = GameVerifier(self, concurrency=self.load_concurrency).run(self.game_ids)
+      assert_true(verification.ok, "Games created concurrently were lost or duplicated.\n%s"
+                  % verification.report())
+    summary = self.latencies.summary()
+    LOG.info("Response times: mean {mean:.4f}s, p50 {p50:.4f}s, p90 {p90:.4f}s, p99 {p99:.4f}s, "
+             "max {max:.4f}s".format(**summary))
     # These are arbitrary times, can be changed depending on the app needs
-    assert_false(avg_response_time > datetime.timedelta(seconds=1),
-                "API response time takes more than 1 second")
-    assert_false(max(self.response_times) > datetime.timedelta(seconds=2),
+    assert_false(summary["p99"] > 1,
+                "The 99th percentile of the API response time is more than 1 second")
+    assert_false(summary["max"] > 2,
                 "One of the responses took more than 2 seconds")
 
-  def create_games(self, N):
-    """
-    Use the API to create N games, we validate for errors and we include
-    them in a global list created by the test that called the method.
-    :param N: Number of games to create.
-    :return: None
-    """
-    for game in xrange(N):
-      if not hasattr(self, "response_times") or \
-          not hasattr(self, "errors") or \
-          not hasattr(self, "game_ids"):
-        raise Exception("Nedded list objects haven't been initialized by the test method.")
-      try:
-        r = self.new_game(data={"numPlayers": 5, "numDice": 5})
-        json_body = self.assert_OK(r)
-        self.assert_game_response_keys(json_body)
-        self.game_ids.append(json_body["_id"])
-        self.response_times.append(r.elapsed)
-      except Exception as e:
-        self.errors.append(e.message)
\ No newline at end of file
+  def create_game(self, payload):
+    """
+    Use the API to create a game and validate the response.
+    :param payload: new game payload
+    :return: id of the game and time taken by the server to respond
+    """
+    r = self.new_game(data=payload)
+    json_body = self.assert_OK(r)
+    self.assert_game_response_keys(json_body)
+    return json_body["_id"], r.elapsed
+
+  def test_open_loop_games(self):
+    """
+    Create games and make claims on them at a fixed (or ramping) arrival rate, the latency
+    is measured from the time each request should have been sent.
+    """
+    if not self.arrival_rate:
+      raise SkipTest("No arrival rate was given for the open loop test.")
+    if self.arrival_rate_end:
+      arrivals = ramp_arrivals(self.arrival_rate, self.arrival_rate_end, self.arrival_duration)
+    else:
+      arrivals = constant_arrivals(self.arrival_rate, self.arrival_duration)
+    arrivals = list(arrivals)
+    # Every arrival creates a game at most, the payloads are generated before the run
+    self.open_payloads = collections.deque(generators.default().game_payloads(len(arrivals)))
+    # Games waiting for their first claim
+    self.open_games = collections.deque()
+    tasks = itertools.cycle((self.create_open_game, self.claim_open_game))
+    result = OpenLoopScheduler(arrivals, max_in_flight=self.max_in_flight).run(tasks)
+    self.report_scenario("open_loop", result.latencies, result.latencies.count,
+                         len(result.errors), result.duration)
+
+    summary = result.latencies.summary()
+    LOG.info("Open loop: {0:.2f} requests/s, mean {mean:.4f}s, p50 {p50:.4f}s, p99 {p99:.4f}s, "
+             "max {max:.4f}s".format(result.throughput, **summary))
+    if result.errors:
+      assert_true(False, "Errors occurred in the open loop test.\n%s"
+                  % "\n".join(e.message for e in result.errors))
+    assert_false(summary["p99"] > 1,
+                "The 99th percentile of the open loop response time is more than 1 second")
+
+  def create_open_game(self):
+    """
+    Create a game that will receive a claim in a later request.
+    """
+    r = self.new_game(data=self.open_payloads.popleft())
+    json_body = self.assert_OK(r)
+    self.assert_game_response_keys(json_body)
+    self.open_games.append(json_body)
+
+  def claim_open_game(self):
+    """
+    Make the first claim of a game created by create_open_game, a game is created if
+    there isn't one available yet.
+    """
+    try:
+      json_body = self.open_games.popleft()
+    except IndexError:
+      return self.create_open_game()
+    r = self.claim(json_body["_id"], data={
+      "player": 0,
+      "claimNumber": 1,
+      "claimFace": json_body["playerHands"][0][0],
+    })
+    self.assert_OK(r)
@@ -1,33 +1,97 @@
 import logging
 import sys
 from nose.tools import assert_equals, assert_true
+from utils import responses
+from utils.bots import Bot
 from utils.generators import random_string
 from nose.exc import SkipTest
 from ldtest import LiarDiceTestBase
 
 LOG = logging.getLogger(__name__)
 
+SCHEMAS = {"claim": responses.CLAIM, "challenge": responses.CHALLENGE}
+
 class GamePlayTest(LiarDiceTestBase):
 
-  def play(self, players, dice):
+  def test_play_game(self):
+    """
+    Play a whole game with bots
+    """
+    self.play(5, 5)
+
+  def test_concurrent_gameplay(self):
+    """
+    Play many games at the same time, every game is a mix of claims, challenges and
+    reads of the game state like the traffic of real players.
+    """
+    if not self.gameplay_games:
+      raise SkipTest("No games were requested for the concurrent gameplay test.")
+    result = self.run_concurrently(lambda: self.play(5, 5) for _ in xrange(self.gameplay_games))
+    self.report_scenario("gameplay", result.latencies, self.gameplay_games, len(result.errors),
+                         result.duration)
+    requests = sum(result.results)
+    LOG.info("Gameplay: {0} games, {1:.2f} games/s, {2:.2f} requests/s, "
+             "game duration p50 {p50:.4f}s, p99 {p99:.4f}s".format(
+                len(result.results), len(result.results) / result.duration,
+                requests / result.duration, **result.latencies.summary()))
+    if result.errors:
+      assert_true(False, "Errors occurred while playing concurrent games.\n%s"
+                  % "\n".join(str(e) for e in result.errors))
+
+  def play(self, players, dice, bot=None, max_turns=1000):
     """
     Generate dummy gameplay to exercise a game from start to end
     The rules in the site aren't quite clear about how the game ends and the rule of placing
     certain number of dice in the center of the table before doing the bid is quite strange.
     The normal rules for a liars dice is to challenge until there's one user with dice in the table.
+    Every player is driven by a bot that claims or challenges in turns, after every action the
+    state of the game is read gameplay_polls times.
     :param players: Number of players
     :param dice: Number of dice
-    :return: None
+    :param bot: utils.bots.Bot that decides the actions of all the players
+    :param max_turns: the game fails if it doesn't end after this number of turns
+    :return: Number of requests made
     """
+    bot = bot or Bot()
     r = self.new_game(data={"numPlayers": players, "numDice": dice})
     json_body = self.assert_OK(r)
-    self._assert_game_response_keys(json_body)
+    self.assert_game_response_keys(json_body)
     game_id = json_body["_id"]
-    while not GamePlayTest.end_game(json_body["playerHands"]):
-      for player in xrange(players):
-        # Skip players that already lost
-        if not GamePlayTest.can_play(player, json_body["playerHands"]):
-          continue
+    requests = 1
+    bid = None
+    player = 0
+    for turn in xrange(max_turns):
+      hands = json_body["playerHands"]
+      if GamePlayTest.end_game(hands):
+        return requests
+      # Skip players that already lost
+      while not GamePlayTest.can_play(player, hands):
+        player = (player + 1) % players
+      total_dice = len(json_body["board"]) + sum(len(hand) for hand in hands)
+      action, data = bot.decide(hands[player], json_body["board"], total_dice, bid)
+      data["player"] = player
+      if action == "challenge":
+        r = self.challenge(game_id, data=data)
+        bid = None
+      else:
+        r = self.claim(game_id, data=data)
+        bid = (data["claimNumber"], data["claimFace"])
+      json_body = self.assert_OK(r)
+      GamePlayTest.assert_valid_action(game_id, action, data, json_body)
+      self.assert_response_schema(SCHEMAS[action], json_body)
+      for _ in xrange(self.gameplay_polls):
+        r = self.get_game(game_id)
+        json_body = self.assert_OK(r)
+        self.assert_game_response_keys(json_body)
+      requests += 1 + self.gameplay_polls
+      player = (player + 1) % players
+    assert_true(False, "Game %s didn't end after %s turns." % (game_id, max_turns))
+
+  @staticmethod
+  def assert_valid_action(game_id, action, data, json_body):
+    if isinstance(json_body, dict) and "error" in json_body:
+      assert_true(False, "The {0} {1} failed in game {2}: {3}".format(
+        action, data, game_id, json_body["error"]))
 
   @staticmethod
   def can_play(player, playerHands):
@@ -41,4 +105,4 @@ class GamePlayTest(LiarDiceTestBase):
       if len(hand) == 0:
         sum = sum + 1
     # Only one player left
-    return sum != players - 1
\ No newline at end of file
+    return sum >= players - 1
@@ -0,0 +1,61 @@
+import itertools
+import json
+import logging
+import os
+import time
+
+from nose.exc import SkipTest
+from nose.tools import assert_true
+from ldtest import LiarDiceTestBase
+from utils.resources import PeakRss
+
+LOG = logging.getLogger(__name__)
+
+class ListingTest(LiarDiceTestBase):
+
+  def test_list_growth(self):
+    """
+    Measure the latency of listing the games and the memory the client needs for it as the
+    number of stored games grows, reading the whole body at once and streaming it.
+    """
+    if not self.list_sizes:
+      raise SkipTest("No sizes were given for the listing benchmark.")
+    stored = sum(1 for _ in self.iter_games(self.list_page_size))
+    rows = list()
+    for size in sorted(self.list_sizes):
+      if size > stored:
+        LOG.info("Creating %s games" % (size - stored))
+        result = self.run_concurrently(itertools.repeat(self.create_game, size - stored))
+        assert_true(not result.errors, "The games for the listing benchmark couldn't be "
+                                       "created: %s" % result.errors[:5])
+        stored = size
+      for mode in ("buffered", "streamed"):
+        row = self.measure(mode)
+        row["size"] = size
+        rows.append(row)
+        LOG.info("Listing {size} games {mode}: {latency:.4f}s, {memory} bytes of memory"
+                 .format(**row))
+        assert_true(row["games"] >= size, "Only {0} of the {1} games were listed {2}".format(
+          row["games"], size, mode))
+    if self.output_directory:
+      with open(os.path.join(self.output_directory, "listing.json"), "w") as f:
+        json.dump(rows, f, indent=2, sort_keys=True)
+
+  def create_game(self):
+    self.assert_OK(self.new_game(data={"numPlayers": 2, "numDice": 5}))
+
+  def measure(self, mode):
+    """
+    List every game once.
+    :param mode: buffered parses the whole body with assert_OK, streamed uses iter_games
+    :return: dict with the games listed, the latency and the growth of the resident memory
+    """
+    with PeakRss() as memory:
+      start = time.time()
+      if mode == "buffered":
+        games = len(self.assert_OK(self.list_games()))
+      else:
+        games = sum(1 for _ in self.iter_games(self.list_page_size))
+      latency = time.time() - start
+    return {"mode": mode, "games": games, "latency": latency, "memory": memory.growth,
+            "page_size": self.list_page_size}
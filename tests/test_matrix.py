@@ -0,0 +1,66 @@
+import itertools
+import json
+import logging
+import os
+import time
+
+from nose.exc import SkipTest
+from nose.tools import assert_true
+from ldtest import LiarDiceTestBase
+from utils import matrix
+
+LOG = logging.getLogger(__name__)
+
+class MatrixTest(LiarDiceTestBase):
+
+  def test_scaling_matrix(self):
+    """
+    Load every endpoint for matrix_duration seconds with every combination of concurrency,
+    keep-alive and game size. The cells are written to matrix.csv, one row each, and the
+    curves of throughput and latency by concurrency with their knee to matrix.json.
+    """
+    if not self.matrix_concurrency:
+      raise SkipTest("No concurrency levels were given for the scaling matrix.")
+    rows = list()
+    keep_alive = type(self).keep_alive
+    try:
+      for endpoint, cell_keep_alive, size, concurrency in matrix.cells(
+          self.matrix_endpoints, self.matrix_keep_alive, self.matrix_sizes,
+          self.matrix_concurrency):
+        # The load threads are new for every cell, so are their sessions
+        type(self).keep_alive = cell_keep_alive
+        result = self.run_concurrently(self.cell_tasks(endpoint, size), concurrency=concurrency)
+        rows.append(matrix.row(endpoint, concurrency, cell_keep_alive, size, result))
+        LOG.info("{0} {1}x{2} games, concurrency {3}, keep-alive {4}: {5:.2f} requests/s, "
+                 "p99 {6:.4f}s, {7} errors".format(endpoint, size[0], size[1], concurrency,
+                                                   cell_keep_alive, result.throughput,
+                                                   rows[-1]["p99"], len(result.errors)))
+    finally:
+      type(self).keep_alive = keep_alive
+    curves = matrix.curves(rows)
+    if self.output_directory:
+      matrix.write_csv(rows, os.path.join(self.output_directory, "matrix.csv"))
+      with open(os.path.join(self.output_directory, "matrix.json"), "w") as f:
+        json.dump(curves, f, indent=2, sort_keys=True)
+    failed = [point for point in rows if point["error_rate"] > self.matrix_error_rate]
+    assert_true(not failed, "The error rate went over {0:.2%} in {1} cells: {2}".format(
+      self.matrix_error_rate, len(failed), ", ".join(
+        "{endpoint} {num_players}x{num_dice} at {concurrency} ({error_rate:.2%})".format(**point)
+        for point in failed[:10])))
+
+  def cell_tasks(self, endpoint, size):
+    """
+    :param endpoint: create_game or get_game
+    :param size: (numPlayers, numDice) of the games
+    :return: tasks calling the endpoint until matrix_duration seconds have passed
+    """
+    data = {"numPlayers": size[0], "numDice": size[1]}
+    if endpoint == "create_game":
+      task = lambda: self.assert_OK(self.new_game(data=data))
+    elif endpoint == "get_game":
+      game_id = self.assert_OK(self.new_game(data=data))["_id"]
+      task = lambda: self.assert_OK(self.get_game(game_id))
+    else:
+      raise ValueError("Unknown endpoint %s" % endpoint)
+    deadline = time.time() + self.matrix_duration
+    return itertools.takewhile(lambda task: time.time() < deadline, itertools.repeat(task))
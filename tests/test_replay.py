@@ -0,0 +1,30 @@
+import logging
+
+from nose.exc import SkipTest
+from nose.tools import assert_true
+from ldtest import LiarDiceTestBase
+from utils.trace import TraceReplayer
+
+LOG = logging.getLogger(__name__)
+
+class ReplayTest(LiarDiceTestBase):
+
+  def test_replay_trace(self):
+    """
+    Replay a trace recorded with --record-trace, the games of the trace are created again
+    and the calls to them are sent to the new games.
+    """
+    if not self.replay_trace:
+      raise SkipTest("No trace was given to replay.")
+    replayer = TraceReplayer(self, self.replay_trace, speed=self.replay_speed,
+                             concurrency=self.load_concurrency,
+                             max_in_flight=self.max_in_flight)
+    result = replayer.run()
+    operations = len(result.results) + len(result.errors)
+    self.report_scenario("replay", result.latencies, operations, len(result.errors),
+                         result.duration)
+    LOG.info("Replay: {0} calls, {1:.2f} calls/s, p50 {p50:.4f}s, p99 {p99:.4f}s".format(
+      operations, result.throughput, **result.latencies.summary()))
+    if result.errors:
+      assert_true(False, "Errors occurred while replaying %s.\n%s"
+                  % (self.replay_trace, "\n".join(str(e) for e in result.errors[:100])))
@@ -0,0 +1,90 @@
+import collections
+import csv
+import itertools
+import logging
+import os
+import threading
+
+from nose.exc import SkipTest
+from nose.tools import assert_true
+from ldtest import LiarDiceTestBase
+from utils.histogram import PERCENTILES
+from utils.load import OpenLoopScheduler, constant_arrivals
+from utils.soak import WindowedMetrics, degradation
+
+LOG = logging.getLogger(__name__)
+
+SOAK_COLUMNS = (["window", "start", "operations", "errors", "throughput", "error_rate", "mean"] +
+                ["p%s" % percentile for percentile in PERCENTILES] + ["max", "late", "stored_games"])
+
+class SoakTest(LiarDiceTestBase):
+
+  def test_soak(self):
+    """
+    Keep a constant load of game creations, claims and reads for soak_duration seconds and
+    follow the metrics in windows of soak_window seconds. The test fails if the latency or
+    the errors grow along the run, which happens when the server leaks memory or slows down
+    as its datastore grows.
+    """
+    if not self.soak_duration:
+      raise SkipTest("No duration was given for the soak test.")
+    self.stored_games = 0
+    self.stored_games_lock = threading.Lock()
+    # Games waiting for their first claim and the last game created, used for the reads
+    self.unclaimed_games = collections.deque(maxlen=10000)
+    self.last_game_id = None
+    self.metrics = WindowedMetrics(window=self.soak_window)
+    observer = lambda intended_time, latency, error: self.metrics.record(
+      intended_time, latency, error, stored_games=self.stored_games)
+    scheduler = OpenLoopScheduler(constant_arrivals(self.soak_rate, self.soak_duration),
+                                  max_in_flight=self.max_in_flight, observer=observer)
+    tasks = itertools.cycle((self.create_soak_game, self.claim_soak_game, self.read_soak_game))
+    result = scheduler.run(tasks)
+    windows = self.metrics.close(stored_games=self.stored_games)
+    self.report_scenario("soak", result.latencies, result.latencies.count, len(result.errors),
+                         result.duration)
+    if self.output_directory:
+      self.write_windows(os.path.join(self.output_directory, "soak.csv"), windows)
+
+    problems = [degradation(windows, "p99", "stored_games", self.soak_degradation),
+                degradation(windows, "error_rate", "window", self.soak_error_rate_growth,
+                            relative=False)]
+    problems = [problem for problem in problems if problem]
+    LOG.info("Soak: {0} operations, {1} errors, {2} games stored".format(
+      result.latencies.count, len(result.errors), self.stored_games))
+    assert_true(not problems, "The server degraded during the soak test.\n%s"
+                % "\n".join(problems))
+
+  def create_soak_game(self):
+    r = self.new_game(data={"numPlayers": 5, "numDice": 5})
+    json_body = self.assert_OK(r)
+    self.assert_game_response_keys(json_body)
+    with self.stored_games_lock:
+      self.stored_games += 1
+    self.unclaimed_games.append(json_body)
+    self.last_game_id = json_body["_id"]
+
+  def claim_soak_game(self):
+    try:
+      json_body = self.unclaimed_games.popleft()
+    except IndexError:
+      return self.create_soak_game()
+    r = self.claim(json_body["_id"], data={
+      "player": 0,
+      "claimNumber": 1,
+      "claimFace": json_body["playerHands"][0][0],
+    })
+    self.assert_OK(r)
+
+  def read_soak_game(self):
+    if self.last_game_id is None:
+      return self.create_soak_game()
+    r = self.get_game(self.last_game_id)
+    self.assert_game_response_keys(self.assert_OK(r))
+
+  @staticmethod
+  def write_windows(path, windows):
+    with open(path, "wb") as f:
+      writer = csv.DictWriter(f, SOAK_COLUMNS, extrasaction="ignore")
+      writer.writeheader()
+      writer.writerows(windows)
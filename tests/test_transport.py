@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import time
+from urlparse import urljoin
+
+from nose.exc import SkipTest
+from nose.tools import assert_equals, assert_true
+from ldtest import LiarDiceTestBase
+from utils.transport import RawTransport, RequestsTransport
+
+LOG = logging.getLogger(__name__)
+
+class TransportTest(LiarDiceTestBase):
+
+  def test_transport_cost(self):
+    """
+    Compare the requests per CPU second of the client with every transport. The same
+    get_game call is made from a single thread, so the CPU time of the process is what
+    the transport costs.
+    """
+    if not self.transport_benchmark:
+      raise SkipTest("No number of requests was given for the transport benchmark.")
+    game = self.pristine_game()
+    url = urljoin(self.connection_string, "games/{0}".format(game["_id"]))
+    backends = [
+      ("requests", RequestsTransport(self.session()), 1),
+      ("raw", RawTransport(keep_alive=self.keep_alive), 1),
+      ("raw", RawTransport(keep_alive=self.keep_alive), self.pipeline_depth),
+    ]
+    rows = list()
+    for name, client, depth in backends:
+      # The first call opens the connection and checks the transport reads the game
+      assert_equals(client.request("GET", url, verify=self.secure_connection).json(), game)
+      row = self.measure(client, url, depth)
+      row["transport"] = name
+      rows.append(row)
+      LOG.info("{transport} transport, pipeline depth {pipeline_depth}: "
+               "{requests_per_cpu_second:.0f} requests per CPU second, "
+               "{requests_per_second:.0f} requests/s".format(**row))
+      assert_true(not row["errors"], "{0} of the calls with the {1} transport failed".format(
+        row["errors"], name))
+    if self.output_directory:
+      with open(os.path.join(self.output_directory, "transport.json"), "w") as f:
+        json.dump(rows, f, indent=2, sort_keys=True)
+
+  def measure(self, client, url, depth):
+    """
+    Make transport_benchmark calls in pipelines of the given depth.
+    :return: dict with the calls, the errors and the CPU and wall seconds they took
+    """
+    calls = [("GET", url, {"verify": self.secure_connection})] * depth
+    batches = max(1, self.transport_benchmark // depth)
+    errors = 0
+    cpu = sum(os.times()[:2])
+    start = time.time()
+    for _ in xrange(batches):
+      for r in client.pipeline(calls):
+        if r.status_code != 200:
+          errors += 1
+    wall = time.time() - start
+    cpu = sum(os.times()[:2]) - cpu
+    requests = batches * depth
+    return {"pipeline_depth": depth, "requests": requests, "errors": errors,
+            "cpu_seconds": cpu, "wall_seconds": wall,
+            "requests_per_cpu_second": requests / cpu if cpu else float("inf"),
+            "requests_per_second": requests / wall if wall else float("inf")}
@@ -0,0 +1,210 @@
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+from utils.histogram import LatencyHistogram, PERCENTILES
+
+LOG = logging.getLogger(__name__)
+
+CSV_COLUMNS = (["scenario", "operations", "errors", "duration", "throughput", "error_rate",
+                "mean"] + ["p%s" % percentile for percentile in PERCENTILES] +
+               ["max", "server_version"])
+
+
+class Scenario(object):
+  """
+  Aggregated result of a load scenario, the results of several runs (or workers) of the
+  same scenario can be added together.
+  """
+  def __init__(self, name):
+    self.name = name
+    self.latencies = LatencyHistogram()
+    self.operations = 0
+    self.errors = 0
+    self.duration = 0.0
+
+  def add(self, latencies, operations, errors, duration):
+    self.latencies.merge(latencies)
+    self.operations += operations
+    self.errors += errors
+    # Workers run at the same time, so the scenario lasts as much as the longest one
+    self.duration = max(self.duration, duration)
+
+  def to_dict(self):
+    return {
+      "operations": self.operations,
+      "errors": self.errors,
+      "duration": self.duration,
+      "throughput": self.operations / self.duration if self.duration else 0.0,
+      "error_rate": self.errors / float(self.operations) if self.operations else 0.0,
+      "latency": self.latencies.summary(),
+    }
+
+
+class Timeline(object):
+  """
+  Latency of the requests in windows of absolute time, so the timelines of several processes
+  and the samples of the server resources line up. The histograms of the windows are coarser
+  than the ones of the scenarios to keep long runs small.
+  """
+  def __init__(self, interval=1.0):
+    self.interval = interval
+    # Window index -> [LatencyHistogram, errors]
+    self.windows = dict()
+    self.lock = threading.Lock()
+
+  def _window(self, index):
+    if index not in self.windows:
+      self.windows[index] = [LatencyHistogram(sub_bucket_bits=5), 0]
+    return self.windows[index]
+
+  def record(self, timestamp, latency, error=False):
+    """
+    :param timestamp: time at which the request was sent
+    :param latency: seconds or timedelta
+    :param error: True if the request failed
+    """
+    with self.lock:
+      window = self._window(int(timestamp // self.interval))
+      window[0].record(latency)
+      if error:
+        window[1] += 1
+
+  def merge(self, other):
+    with self.lock:
+      for index, (latencies, errors) in other.windows.items():
+        window = self._window(index)
+        window[0].merge(latencies)
+        window[1] += errors
+
+  def rows(self):
+    """
+    :return: list with the time, operations, errors and latency percentiles of every window
+    """
+    with self.lock:
+      rows = list()
+      for index in sorted(self.windows):
+        latencies, errors = self.windows[index]
+        row = latencies.summary()
+        row.update(time=index * self.interval, operations=row.pop("count"), errors=errors)
+        rows.append(row)
+      return rows
+
+  def to_dict(self):
+    with self.lock:
+      return {"interval": self.interval,
+              "windows": dict((index, [latencies.to_dict(), errors])
+                              for index, (latencies, errors) in self.windows.items())}
+
+  @classmethod
+  def from_dict(cls, data):
+    timeline = cls(data["interval"])
+    for index, (latencies, errors) in data["windows"].items():
+      timeline.windows[int(index)] = [LatencyHistogram.from_dict(latencies), errors]
+    return timeline
+
+
+class BenchmarkReport(object):
+  """
+  Throughput, latency percentiles and error rate of the load scenarios of a run.
+  """
+  def __init__(self):
+    self.scenarios = dict()
+    self.server_version = None
+    # Client latency and server resources by window, see utils.resources.align
+    self.timeline = None
+    # Hit ratios of the game cache, see utils.cache.GameCache.report
+    self.cache = None
+    self.lock = threading.Lock()
+
+  def add(self, name, latencies, operations, errors, duration):
+    """
+    Add the result of a scenario.
+    :param name: name of the scenario
+    :param latencies: LatencyHistogram of the operations
+    :param operations: number of operations, including the ones that failed
+    :param errors: number of operations that failed
+    :param duration: seconds
+    """
+    with self.lock:
+      if name not in self.scenarios:
+        self.scenarios[name] = Scenario(name)
+      self.scenarios[name].add(latencies, operations, errors, duration)
+
+  def to_dict(self):
+    with self.lock:
+      return {
+        "created": datetime.datetime.utcnow().isoformat(),
+        "server_version": self.server_version,
+        "scenarios": dict((name, scenario.to_dict())
+                          for name, scenario in self.scenarios.items()),
+        "timeline": self.timeline,
+        "cache": self.cache,
+      }
+
+  def write(self, output_directory):
+    """
+    Write benchmark.json and benchmark.csv in the output directory, and timeline.csv when
+    the run has a timeline.
+    :return: dict written to benchmark.json
+    """
+    report = self.to_dict()
+    with open(os.path.join(output_directory, "benchmark.json"), "w") as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+    with open(os.path.join(output_directory, "benchmark.csv"), "wb") as f:
+      writer = csv.DictWriter(f, CSV_COLUMNS)
+      writer.writeheader()
+      for name, scenario in sorted(report["scenarios"].items()):
+        row = dict((key, scenario[key]) for key in CSV_COLUMNS if key in scenario)
+        row.update(scenario["latency"])
+        row.update(scenario=name, server_version=report["server_version"])
+        writer.writerow(dict((key, row.get(key)) for key in CSV_COLUMNS))
+    if report["timeline"]:
+      columns = sorted(set(key for row in report["timeline"] for key in row))
+      columns.remove("time")
+      with open(os.path.join(output_directory, "timeline.csv"), "wb") as f:
+        writer = csv.DictWriter(f, ["time"] + columns)
+        writer.writeheader()
+        writer.writerows(report["timeline"])
+    return report
+
+
+def compare(baseline, current, latency_tolerance=0.2, throughput_tolerance=0.2,
+            error_rate_tolerance=0.01):
+  """
+  Compare the scenarios of two benchmark reports, only the scenarios in both are checked.
+  :param baseline: dict of a previous benchmark.json
+  :param current: dict of the current run
+  :param latency_tolerance: relative increase allowed in the mean, p50 and p99
+  :param throughput_tolerance: relative decrease allowed in the throughput
+  :param error_rate_tolerance: absolute increase allowed in the error rate
+  :return: list of messages describing the regressions
+  """
+  regressions = list()
+  for name, scenario in sorted(current["scenarios"].items()):
+    previous = baseline["scenarios"].get(name)
+    if previous is None:
+      LOG.info("Scenario %s isn't in the baseline" % name)
+      continue
+    for key in ("mean", "p50", "p99"):
+      before, after = previous["latency"][key], scenario["latency"][key]
+      if after > before * (1 + latency_tolerance):
+        regressions.append("{0}: {1} latency went from {2:.4f}s to {3:.4f}s".format(
+          name, key, before, after))
+    before, after = previous["throughput"], scenario["throughput"]
+    if after < before * (1 - throughput_tolerance):
+      regressions.append("{0}: throughput went from {1:.2f}/s to {2:.2f}/s".format(
+        name, before, after))
+    before, after = previous["error_rate"], scenario["error_rate"]
+    if after > before + error_rate_tolerance:
+      regressions.append("{0}: error rate went from {1:.2%} to {2:.2%}".format(
+        name, before, after))
+  return regressions
+
+
+# Report of the scenarios run by this process
+REPORT = BenchmarkReport()
+# Timeline of the requests made by this process, None when it isn't being recorded
+TIMELINE = None
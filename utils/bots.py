@@ -0,0 +1,58 @@
+import collections
+import random
+
+FACES = 6
+
+
+class Bot(object):
+  """
+  Simple Liar's Dice player. It bids on the face it has the most, sometimes moving one of
+  those dice to the center, and challenges the bids that are unlikely given its own hand
+  and the dice in the center.
+  """
+  def __init__(self, rng=None, move_probability=0.2, bluff_margin=1):
+    """
+    :param rng: random.Random used for the decisions
+    :param move_probability: probability of moving a die to the center with a claim
+    :param bluff_margin: number of dice above the expected count tolerated before challenging
+    """
+    self.rng = rng or random.Random()
+    self.move_probability = move_probability
+    self.bluff_margin = bluff_margin
+
+  def expected(self, face, hand, board, total_dice):
+    """
+    :return: expected number of dice with the face in the game, from the point of view
+    of the player
+    """
+    unknown = total_dice - len(hand) - len(board)
+    return hand.count(face) + board.count(face) + unknown / float(FACES)
+
+  def decide(self, hand, board, total_dice, bid):
+    """
+    Choose the next action of the player.
+    :param hand: faces in the hand of the player
+    :param board: faces in the center of the table
+    :param total_dice: dice in the game, hands and center
+    :param bid: current (claimNumber, claimFace) or None at the start of a round
+    :return: tuple ("challenge", data) or ("claim", data) with the body of the request
+    """
+    if bid is not None:
+      number, face = bid
+      if number > self.expected(face, hand, board, total_dice) + self.bluff_margin:
+        return "challenge", {}
+    counts = collections.Counter(hand)
+    most = max(counts.values())
+    face = self.rng.choice([f for f, count in counts.items() if count == most])
+    if bid is None:
+      number = max(int(self.expected(face, hand, board, total_dice)), 1)
+    else:
+      number = bid[0] if face > bid[1] else bid[0] + 1
+    if number > total_dice:
+      return "challenge", {}
+    data = {"claimNumber": number, "claimFace": face}
+    # Always keep a die in the hand, a player without dice lost
+    if len(hand) > 1 and self.rng.random() < self.move_probability:
+      data["moveNumber"] = 1
+      data["moveFace"] = face
+    return "claim", data
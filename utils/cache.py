@@ -0,0 +1,98 @@
+import collections
+import logging
+import threading
+
+LOG = logging.getLogger(__name__)
+
+# Cache used by LiarDiceTestBase.get_game, None when the responses aren't cached
+CACHE = None
+
+
+class GameCache(object):
+  """
+  LRU cache of the get_game responses by game id. A response with an ETag is revalidated
+  with If-None-Match on every read, one without it is served from the cache until the game
+  is invalidated by a claim or a challenge of this client. Every invalidation moves the
+  generation of the game, a response read in an older generation isn't stored.
+  """
+  def __init__(self, capacity=1000):
+    """
+    :param capacity: number of games kept
+    """
+    self.capacity = capacity
+    self.entries = collections.OrderedDict()
+    # Invalidations by game id
+    self.generations = collections.Counter()
+    self.lock = threading.Lock()
+    self.stats = collections.Counter()
+
+  def lookup(self, id):
+    """
+    :param id: game id
+    :return: the cached requests.Response (None if the game isn't cached), its ETag (None if
+    the server didn't send one) and the generation of the game to pass to store
+    """
+    with self.lock:
+      self.stats["lookups"] += 1
+      generation = self.generations[id]
+      response = self.entries.pop(id, None)
+      if response is None:
+        return None, None, generation
+      # Most recently used at the end
+      self.entries[id] = response
+      return response, response.headers.get("etag"), generation
+
+  def store(self, id, response, generation):
+    """
+    Cache a successful response of a game.
+    :param generation: generation returned by the lookup made before the request, the
+    response isn't stored if the game was invalidated since
+    """
+    if response.status_code != 200:
+      return
+    with self.lock:
+      if self.generations[id] != generation:
+        return
+      self.entries.pop(id, None)
+      self.entries[id] = response
+      if len(self.entries) > self.capacity:
+        self.entries.popitem(last=False)
+        self.stats["evictions"] += 1
+
+  def count(self, outcome):
+    """
+    :param outcome: hits (served from the cache), revalidated (304) or misses
+    """
+    with self.lock:
+      self.stats[outcome] += 1
+
+  def invalidate(self, id):
+    with self.lock:
+      self.generations[id] += 1
+      if self.entries.pop(id, None) is not None:
+        self.stats["invalidations"] += 1
+
+  def report(self):
+    """
+    :return: dict with the counters, the ratio of reads answered by the cache (hit_ratio)
+    and the ratio of reads that didn't reach the server at all (saved_ratio)
+    """
+    with self.lock:
+      report = dict((key, self.stats[key]) for key in ("lookups", "hits", "revalidated",
+                                                       "misses", "invalidations", "evictions"))
+    lookups = float(report["lookups"]) or 1.0
+    report["hit_ratio"] = (report["hits"] + report["revalidated"]) / lookups
+    report["saved_ratio"] = report["hits"] / lookups
+    return report
+
+
+def combine(reports):
+  """
+  :param reports: reports of several caches, e.g. one per worker
+  :return: report with the counters added up
+  """
+  total = GameCache()
+  for report in reports:
+    total.stats.update(dict((key, value) for key, value in report.items()
+                            if not key.endswith("_ratio")))
+  return total.report()
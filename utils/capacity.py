@@ -0,0 +1,113 @@
+import logging
+
+LOG = logging.getLogger(__name__)
+
+SEARCHES = ("binary", "step")
+
+
+class CapacitySearch(object):
+  """
+  Find the highest load a server sustains without breaking a latency SLO or an error rate
+  limit. The load (requests per second or concurrency, whatever the probe understands) is
+  multiplied by growth until the limits are breached, the binary search then narrows the
+  interval between the last load that passed and the first one that failed.
+
+    search = CapacitySearch(lambda rate: run_at(rate), slo=0.5, percentile=99)
+    outcome = search.run()
+  """
+  def __init__(self, probe, slo=1.0, percentile=99, max_error_rate=0.01, start=10,
+               limit=10000, growth=2.0, precision=0.1, search="binary", integer=False):
+    """
+    :param probe: callable(load) that runs a step and returns its utils.load.LoadResult
+    :param slo: seconds the percentile of the latency must stay under
+    :param percentile: percentile of the latency checked against the slo
+    :param max_error_rate: fraction of failed requests allowed
+    :param start: load of the first step
+    :param limit: highest load tried
+    :param growth: factor between the loads of consecutive steps of the ramp
+    :param precision: the binary search stops when the interval is narrower than this
+    fraction of the load
+    :param search: binary or step, step only ramps the load
+    :param integer: the loads are whole numbers, e.g. a concurrency
+    """
+    if search not in SEARCHES:
+      raise ValueError("Unknown search %s, expected one of %s" % (search, ", ".join(SEARCHES)))
+    self.probe = probe
+    self.slo = slo
+    self.percentile = percentile
+    self.max_error_rate = max_error_rate
+    self.start = start
+    self.limit = limit
+    self.growth = growth
+    self.precision = precision
+    self.search = search
+    self.integer = integer
+    self.steps = list()
+
+  def measure(self, load):
+    """
+    Run a step and check it against the limits.
+    :return: dict describing the step
+    """
+    result = self.probe(load)
+    operations = len(result.results) + len(result.errors)
+    step = {
+      "load": load,
+      "throughput": result.throughput,
+      "operations": operations,
+      "errors": len(result.errors),
+      "error_rate": len(result.errors) / float(operations) if operations else 0.0,
+      "mean": result.latencies.mean,
+      "latency": result.latencies.percentile(self.percentile),
+    }
+    step["passed"] = (operations > 0 and step["latency"] <= self.slo and
+                      step["error_rate"] <= self.max_error_rate)
+    LOG.info("Load {load:g}: {throughput:.2f} requests/s, p{0} {latency:.4f}s, "
+             "{error_rate:.2%} errors, {1}".format(
+               self.percentile, "passed" if step["passed"] else "failed", **step))
+    self.steps.append(step)
+    return step
+
+  def run(self):
+    """
+    :return: dict with the highest load that passed (capacity, None if not even the first
+    step did), its throughput, the knee of the curve and every step measured
+    """
+    passed, failed = None, None
+    load = self.start
+    while load <= self.limit:
+      if not self.measure(load)["passed"]:
+        failed = load
+        break
+      passed = load
+      load = max(int(load * self.growth), load + 1) if self.integer else load * self.growth
+    if self.search == "binary" and passed is not None and failed is not None:
+      while (failed - passed) > max(self.precision * passed, 1 if self.integer else 0):
+        load = (passed + failed) // 2 if self.integer else (passed + failed) / 2.0
+        if self.measure(load)["passed"]:
+          passed = load
+        else:
+          failed = load
+    best = [step for step in self.steps if step["passed"] and step["load"] == passed]
+    return {
+      "capacity": passed,
+      "throughput": best[0]["throughput"] if best else None,
+      "knee": knee(self.steps),
+      "slo": self.slo,
+      "percentile": self.percentile,
+      "max_error_rate": self.max_error_rate,
+      "steps": sorted(self.steps, key=lambda step: step["load"]),
+    }
+
+
+def knee(steps):
+  """
+  Knee of the throughput/latency curve: the step with the highest power (throughput divided
+  by mean latency), beyond it the latency grows faster than the throughput.
+  :param steps: steps measured by CapacitySearch
+  :return: load of the knee, None if no step completed a request
+  """
+  steps = [step for step in steps if step["operations"] and step["mean"] > 0]
+  if not steps:
+    return None
+  return max(steps, key=lambda step: step["throughput"] / step["mean"])["load"]
@@ -0,0 +1,232 @@
+import collections
+import logging
+import re
+import string
+import sys
+from utils import generators
+from utils.load import LoadDriver
+
+LOG = logging.getLogger(__name__)
+
+# Payload fields of the endpoints and a valid value for each one
+GAME_FIELDS = {"numPlayers": 5, "numDice": 5}
+CLAIM_FIELDS = {"player": 0, "moveNumber": 1, "moveFace": 1, "claimNumber": 1, "claimFace": 1}
+
+# Marks a field left out of the payload
+MISSING = object()
+
+
+def values(generator=None, oversized=(1024, 1024 * 1024)):
+  """
+  Values every field gets fuzzed with: wrong types, boundaries of the integers and strings.
+  :param generator: utils.generators.Generator of the random strings, the default one if None
+  :param oversized: lengths of the oversized strings
+  :return: list of values
+  """
+  generator = generator or generators.default()
+  integers = [0, 1, -1, 2, 4, 5, 6, 7, 100, 101, 2 ** 31 - 1, 2 ** 31, 2 ** 53 + 1,
+              sys.maxint, sys.maxint + 1, -sys.maxint - 1]
+  strings = ["", " ", "5", "-1", "0x10", "1e309", "null", "[]", "{}", u"\u0665", u"\u2603",
+             "%00", "' OR '1'='1", generator.string(64, string.printable)]
+  strings.extend("9" * length for length in oversized)
+  return integers + strings + [None, True, False, 17.5, -0.0, 1e308, [], [1, 2], {}]
+
+
+def payloads(fields, fuzz_values, generator=None, combinations=0):
+  """
+  Build the payloads of a corpus up front: every field with every value while the rest
+  keep their valid value, every field left out, and random combinations of several fuzzed
+  fields.
+  :param fields: dict with a valid value of every field, e.g. GAME_FIELDS
+  :param fuzz_values: values returned by values()
+  :param generator: utils.generators.Generator of the combinations, the default one if None
+  :param combinations: number of payloads with several fuzzed fields
+  :return: list of (description, payload)
+  """
+  rng = (generator or generators.default()).random
+  corpus = [("empty payload", {})]
+  for field in sorted(fields):
+    corpus.append(("no %s" % field, build(fields, {field: MISSING})))
+    for value in fuzz_values:
+      corpus.append(("%s is %s" % (field, describe(value)), build(fields, {field: value})))
+  choices = list(fuzz_values) + [MISSING]
+  for _ in xrange(combinations):
+    fuzzed = rng.sample(sorted(fields), rng.randint(2, len(fields)))
+    changes = dict((field, rng.choice(choices)) for field in fuzzed)
+    corpus.append((", ".join("%s is %s" % (field, describe(changes[field]))
+                             for field in fuzzed), build(fields, changes)))
+  return corpus
+
+
+def ids(generator=None, lengths=xrange(1, 1500)):
+  """
+  :param generator: utils.generators.Generator, the default one if None
+  :param lengths: lengths of the random ids
+  :return: list of game ids that don't exist, plus ids with characters that need quoting
+  """
+  generator = generator or generators.default()
+  lengths = list(lengths)
+  # Drawn at once and sliced
+  data = generator.string(sum(lengths))
+  corpus = list()
+  start = 0
+  for length in lengths:
+    corpus.append(data[start:start + length])
+    start += length
+  return corpus + ["null", "undefined", "0", "-1", "%00", "a b", u"\u2603".encode("utf-8"),
+                   "{}", "[]"]
+
+
+def build(fields, changes):
+  payload = dict(fields)
+  for field, value in changes.items():
+    if value is MISSING:
+      payload.pop(field, None)
+    else:
+      payload[field] = value
+  return payload
+
+
+def describe(value, limit=20):
+  if value is MISSING:
+    return "missing"
+  text = repr(value)
+  return text if len(text) <= limit else "%s... (%s characters)" % (text[:limit], len(text))
+
+
+def signature(outcome, payload=None):
+  """
+  Group the outcomes of a fuzz case. Errors are grouped by their message with the input and
+  the numbers masked, other json bodies by their keys, so the same behaviour for different
+  inputs has the same signature.
+  :param outcome: requests.Response or the exception raised by the request
+  :param payload: input of the case, its strings are masked in the messages
+  :return: tuple
+  """
+  if isinstance(outcome, Exception):
+    return (type(outcome).__name__, _mask(str(outcome), payload))
+  try:
+    body = outcome.json()
+  except ValueError:
+    return (outcome.status_code, _mask(outcome.content, payload))
+  if isinstance(body, dict):
+    if "error" in body:
+      return (outcome.status_code, "error", _mask(unicode(body["error"]), payload))
+    return (outcome.status_code, "object") + tuple(sorted(body))
+  return (outcome.status_code, type(body).__name__)
+
+
+def _mask(text, payload=None, limit=120):
+  text = _unicode(text)
+  inputs = payload.values() if isinstance(payload, dict) else [payload]
+  for value in inputs:
+    if isinstance(value, basestring) and value:
+      text = text.replace(_unicode(value), u"<input>")
+  return re.sub(r"\d+", "N", text[:limit])
+
+
+def _unicode(text):
+  return text if isinstance(text, unicode) else text.decode("utf-8", "replace")
+
+
+class FuzzResult(object):
+  """
+  Outcomes of a fuzz run grouped by signature, every group keeps the first case found.
+  """
+  def __init__(self):
+    self.groups = collections.OrderedDict()
+    self.cases = 0
+
+  def add(self, description, payload, outcome, problem):
+    key = signature(outcome, payload)
+    if key not in self.groups:
+      self.groups[key] = {"count": 0, "description": description, "payload": payload,
+                          "problem": problem}
+    self.groups[key]["count"] += 1
+    self.cases += 1
+
+  def problems(self):
+    """
+    :return: list of (signature, group) of the groups with a problem
+    """
+    return [(key, group) for key, group in self.groups.items() if group["problem"]]
+
+  def report(self):
+    """
+    :return: one line per group with a problem
+    """
+    return "\n".join("{0}: {1} cases, e.g. {2}, payload {3}: {4!r}".format(
+      group["problem"], group["count"], group["description"], describe(group["payload"], 200),
+      key) for key, group in self.problems())
+
+
+class FuzzEngine(object):
+  """
+  Send a corpus of inputs concurrently and check every outcome.
+
+    engine = FuzzEngine(lambda payload: self.new_game(data=payload), check)
+    result = engine.run(payloads(GAME_FIELDS, values()))
+  """
+  def __init__(self, send, check, concurrency=20):
+    """
+    :param send: callable(payload) that makes the request and returns the requests.Response
+    :param check: callable(outcome) with the response (or the exception raised) that returns
+    a description of the problem, None if the outcome is acceptable
+    :param concurrency: number of requests in flight
+    """
+    self.send = send
+    self.check = check
+    self.concurrency = concurrency
+
+  def run(self, corpus):
+    """
+    :param corpus: iterable of (description, payload)
+    :return: FuzzResult
+    """
+    result = FuzzResult()
+    outcomes = LoadDriver(concurrency=self.concurrency).run(
+      self.task(description, payload) for description, payload in corpus)
+    for description, payload, outcome in outcomes.results:
+      result.add(description, payload, outcome, self.check(outcome))
+    LOG.info("Fuzzed {0} cases, {1} signatures, {2} with problems".format(
+      result.cases, len(result.groups), len(result.problems())))
+    return result
+
+  def task(self, description, payload):
+    def fuzz():
+      try:
+        outcome = self.send(payload)
+      except Exception as e:
+        outcome = e
+      return description, payload, outcome
+    return fuzz
+
+
+def server_failure(outcome):
+  """
+  Default check of the fuzz tests: the server must answer every input, without a 5xx and
+  with a json body.
+  """
+  if isinstance(outcome, Exception):
+    return "The request failed"
+  if outcome.status_code >= 500:
+    return "Server error"
+  try:
+    outcome.json()
+  except ValueError:
+    return "Invalid json"
+  return None
+
+
+def error_expected(outcome):
+  """
+  Check of the inputs that must be rejected: besides answering, the server must answer with
+  an error body or a 4xx.
+  """
+  problem = server_failure(outcome)
+  if problem is not None:
+    return problem
+  body = outcome.json()
+  if outcome.status_code < 400 and not (isinstance(body, dict) and "error" in body):
+    return "Not an error"
+  return None
@@ -1,5 +1,184 @@
-import string
+import binascii
+import logging
+import os
 import random
+import string
+import threading
+
+LOG = logging.getLogger(__name__)
+
+ALPHABET = string.ascii_uppercase + string.digits
+# Random bytes generated at once and sliced by the calls
+BUFFER_SIZE = 64 * 1024
+
+
+class Generator(object):
+  """
+  Random test data in bulk. The bytes come from a buffer refilled in large blocks and are
+  mapped to characters with str.translate, so a string costs a slice and a translate no
+  matter its length. By default it uses a seeded PRNG, so a run can be repeated with the
+  same seed; the operating system's cryptographic source is opt-in. It is safe to use from
+  several threads, but their draws interleave in the order the threads happen to run, so
+  only what a single thread draws, e.g. the corpora built before a load test starts, is
+  repeated by the seed.
+
+    generator = Generator(seed=1234)
+    ids = generator.strings(1000, 24)
+  """
+  def __init__(self, seed=None, secure=False, buffer_size=BUFFER_SIZE):
+    """
+    :param seed: seed of the PRNG, a random one is picked (and can be read from seed) if None
+    :param secure: use os.urandom instead of a PRNG, the seed is ignored
+    :param buffer_size: number of random bytes generated at once
+    """
+    self.secure = secure
+    if secure:
+      self.seed = None
+      self.random = random.SystemRandom()
+    else:
+      self.seed = seed if seed is not None else new_seed()
+      self.random = random.Random(self.seed)
+    self.buffer_size = buffer_size
+    self.buffer = ""
+    self.position = 0
+    self.lock = threading.Lock()
+    # Translate tables by alphabet
+    self.tables = dict()
+
+  def bytes(self, n):
+    """
+    :return: str with n random bytes
+    """
+    with self.lock:
+      if self.position + n > len(self.buffer):
+        self.buffer = self.buffer[self.position:] + self._generate(max(n, self.buffer_size))
+        self.position = 0
+      data = self.buffer[self.position:self.position + n]
+      self.position += n
+      return data
+
+  def _generate(self, n):
+    if self.secure:
+      return os.urandom(n)
+    return binascii.unhexlify("%0*x" % (2 * n, self.random.getrandbits(8 * n)))
+
+  def string(self, length, alphabet=ALPHABET):
+    """
+    :param length: number of characters
+    :param alphabet: str with the characters to choose from, at most 256
+    :return: random str
+    """
+    if alphabet not in self.tables:
+      self.tables[alphabet] = translate_table(alphabet)
+    table, rejected = self.tables[alphabet]
+    chunks = list()
+    missing = length
+    while missing > 0:
+      # Bytes that would make some characters more likely than others are dropped
+      chunk = self.bytes(missing).translate(table, rejected)
+      chunks.append(chunk)
+      missing -= len(chunk)
+    return "".join(chunks)
+
+  def strings(self, count, length, alphabet=ALPHABET):
+    """
+    :return: list of count random strings of the given length
+    """
+    data = self.string(count * length, alphabet)
+    return [data[i:i + length] for i in xrange(0, count * length, length)]
+
+  def integers(self, count, low, high):
+    """
+    Every integer takes as few bytes of the buffer as its range needs, the values that would
+    make some integers more likely than others are dropped.
+    :return: list of count random integers between low and high, both included
+    """
+    span = high - low + 1
+    if span < 1:
+      raise ValueError("The lowest integer can't be higher than the highest one.")
+    if span == 1:
+      return [low] * count
+    width = 1
+    while 256 ** width < span:
+      width += 1
+    limit = 256 ** width - 256 ** width % span
+    integers = list()
+    while len(integers) < count:
+      data = self.bytes((count - len(integers)) * width)
+      if width == 1:
+        values = bytearray(data)
+      else:
+        values = [int(binascii.hexlify(data[i:i + width]), 16)
+                  for i in xrange(0, len(data), width)]
+      integers.extend(low + value % span for value in values if value < limit)
+    return integers
+
+  def game_payloads(self, count, players=(2, 10), dice=5):
+    """
+    :param count: number of payloads
+    :param players: (lowest, highest) number of players
+    :param dice: number of dice of every player
+    :return: list of new game payloads
+    """
+    return [{"numPlayers": n, "numDice": dice} for n in self.integers(count, *players)]
+
+  def claim_payloads(self, count, players=5, total_dice=25, faces=6):
+    """
+    :param count: number of payloads
+    :param players: number of players of the game
+    :param total_dice: dice in the game, the highest claim number
+    :param faces: faces of the dice
+    :return: list of claim payloads
+    """
+    return [{"player": player, "claimNumber": number, "claimFace": face}
+            for player, number, face in zip(self.integers(count, 0, players - 1),
+                                            self.integers(count, 1, total_dice),
+                                            self.integers(count, 1, faces))]
+
+
+def translate_table(alphabet):
+  """
+  :return: table mapping every byte to a character of the alphabet and the bytes rejected
+  so all the characters are equally likely
+  """
+  if not 0 < len(alphabet) <= 256:
+    raise ValueError("The alphabet must have between 1 and 256 characters.")
+  limit = 256 - 256 % len(alphabet)
+  table = "".join(alphabet[i % len(alphabet)] if i < limit else "\0" for i in xrange(256))
+  return table, "".join(chr(i) for i in xrange(limit, 256))
+
+
+def new_seed():
+  return int(binascii.hexlify(os.urandom(8)), 16)
+
+
+_default = None
+
+
+def seed(value=None, secure=False):
+  """
+  Replace the generator used by the module functions, e.g. to repeat a run.
+  :param value: seed, a random one is picked if None
+  :param secure: use the operating system's cryptographic source
+  :return: the new Generator
+  """
+  global _default
+  _default = Generator(value, secure)
+  if secure:
+    LOG.info("Generating random data from the system's secure source")
+  else:
+    LOG.info("Random data seed: %s" % _default.seed)
+  return _default
+
+
+def default():
+  """
+  :return: Generator used by the module functions
+  """
+  if _default is None:
+    return seed()
+  return _default
+
 
 def random_string(N):
-  return ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(N))
+  return default().string(N)
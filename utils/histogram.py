@@ -0,0 +1,148 @@
+import array
+import datetime
+
+# Percentiles included in the summaries
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram(object):
+  """
+  Latency histogram with a fixed memory footprint, in the spirit of HdrHistogram.
+  Values are recorded in microseconds. Every power of two range is split in linear
+  sub buckets, so the error of any percentile is below 1 / 2 ** (sub_bucket_bits - 1).
+  Two histograms with the same configuration can be merged, which allows to record
+  in several threads or processes and aggregate at the end.
+  The histogram is not thread safe.
+  """
+  def __init__(self, max_seconds=60, sub_bucket_bits=8):
+    """
+    :param max_seconds: highest value tracked, higher values are counted in the last bucket
+    :param sub_bucket_bits: precision of the buckets
+    """
+    self.max_seconds = max_seconds
+    self.sub_bucket_bits = sub_bucket_bits
+    self.sub_bucket_count = 1 << sub_bucket_bits
+    self.sub_bucket_half = self.sub_bucket_count >> 1
+    self.highest_value = int(max_seconds * 1000000)
+    self.counts = array.array("L", [0]) * (self._index(self.highest_value) + 1)
+    self.count = 0
+    self.total = 0
+    self.min = None
+    self.max = None
+
+  def _index(self, value):
+    if value < self.sub_bucket_count:
+      return value
+    exponent = value.bit_length() - self.sub_bucket_bits
+    return (self.sub_bucket_count + (exponent - 1) * self.sub_bucket_half
+            + (value >> exponent) - self.sub_bucket_half)
+
+  def _highest_equivalent(self, index):
+    """
+    :return: highest value in microseconds counted in the bucket
+    """
+    if index < self.sub_bucket_count:
+      return index
+    exponent = (index - self.sub_bucket_count) // self.sub_bucket_half + 1
+    sub_bucket = (index - self.sub_bucket_count) % self.sub_bucket_half + self.sub_bucket_half
+    return ((sub_bucket + 1) << exponent) - 1
+
+  def record(self, seconds):
+    """
+    Record a latency.
+    :param seconds: latency in seconds or datetime.timedelta
+    """
+    if isinstance(seconds, datetime.timedelta):
+      seconds = seconds.total_seconds()
+    value = max(int(seconds * 1000000), 0)
+    self.counts[self._index(min(value, self.highest_value))] += 1
+    self.count += 1
+    self.total += value
+    if self.min is None or value < self.min:
+      self.min = value
+    if self.max is None or value > self.max:
+      self.max = value
+
+  def merge(self, other):
+    """
+    Add the values recorded in other histogram to this one.
+    :param other: LatencyHistogram with the same configuration
+    :return: self
+    """
+    if (other.max_seconds, other.sub_bucket_bits) != (self.max_seconds, self.sub_bucket_bits):
+      raise ValueError("Histograms with different configurations can't be merged.")
+    for index, count in enumerate(other.counts):
+      if count:
+        self.counts[index] += count
+    self.count += other.count
+    self.total += other.total
+    for value in (other.min, other.max):
+      if value is not None:
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+    return self
+
+  @property
+  def mean(self):
+    """
+    :return: mean latency in seconds
+    """
+    return self.total / 1000000.0 / self.count if self.count else 0.0
+
+  def percentile(self, percentile):
+    """
+    :param percentile: percentile between 0 and 100
+    :return: latency in seconds below which the percentile of the values fall
+    """
+    if not self.count:
+      return 0.0
+    target = max(int(round(self.count * percentile / 100.0)), 1)
+    seen = 0
+    for index, count in enumerate(self.counts):
+      seen += count
+      if seen >= target:
+        return min(self._highest_equivalent(index), self.max) / 1000000.0
+    return self.max / 1000000.0
+
+  def summary(self):
+    """
+    :return: dict with the count, mean, max and PERCENTILES in seconds
+    """
+    summary = {
+      "count": self.count,
+      "mean": self.mean,
+      "max": self.max / 1000000.0 if self.max is not None else 0.0,
+    }
+    for percentile in PERCENTILES:
+      summary["p%s" % percentile] = self.percentile(percentile)
+    return summary
+
+  def to_dict(self):
+    """
+    Serialize the histogram, only the buckets with values are kept.
+    :return: dict that can be pickled or dumped as json
+    """
+    return {
+      "max_seconds": self.max_seconds,
+      "sub_bucket_bits": self.sub_bucket_bits,
+      "counts": [(index, count) for index, count in enumerate(self.counts) if count],
+      "count": self.count,
+      "total": self.total,
+      "min": self.min,
+      "max": self.max,
+    }
+
+  @classmethod
+  def from_dict(cls, data):
+    """
+    :param data: dict created by to_dict
+    :return: LatencyHistogram
+    """
+    histogram = cls(data["max_seconds"], data["sub_bucket_bits"])
+    for index, count in data["counts"]:
+      histogram.counts[index] = count
+    histogram.count = data["count"]
+    histogram.total = data["total"]
+    histogram.min = data["min"]
+    histogram.max = data["max"]
+    return histogram
@@ -0,0 +1,236 @@
+import itertools
+import logging
+import math
+import Queue
+import threading
+import time
+from utils.histogram import LatencyHistogram
+
+LOG = logging.getLogger(__name__)
+
+# Stack size of the load threads, the default 8MB would limit us to a few hundred threads
+THREAD_STACK_SIZE = 256 * 1024
+
+
+class LoadResult(object):
+  """
+  Outcome of a load run
+  """
+  def __init__(self):
+    self.results = list()
+    self.errors = list()
+    # Time taken by every task, measured from its intended send time in open loop runs
+    self.latencies = LatencyHistogram()
+    self.start = None
+    self.end = None
+
+  def merge(self, other):
+    """
+    Add the results, errors and latencies of another result, e.g. the buffer of a thread.
+    """
+    self.results.extend(other.results)
+    self.errors.extend(other.errors)
+    self.latencies.merge(other.latencies)
+
+  @property
+  def duration(self):
+    """
+    :return: wall time of the run in seconds
+    """
+    return self.end - self.start
+
+  @property
+  def throughput(self):
+    """
+    :return: completed requests per second
+    """
+    total = len(self.results) + len(self.errors)
+    return total / self.duration if self.duration else 0.0
+
+
+class Pacer(object):
+  """
+  Spaces the calls made by all the threads so together they don't go over rate calls per second.
+  """
+  def __init__(self, rate):
+    self.interval = 1.0 / rate
+    self.next_time = None
+    self.lock = threading.Lock()
+
+  def wait(self):
+    with self.lock:
+      now = time.time()
+      if self.next_time is None or self.next_time < now:
+        self.next_time = now
+      send_time = self.next_time
+      self.next_time += self.interval
+    delay = send_time - time.time()
+    if delay > 0:
+      time.sleep(delay)
+
+
+class LoadDriver(object):
+  """
+  Executes calls to the API keeping up to concurrency requests in flight.
+  Every task is a callable that makes a request using the LiarDiceTestBase helpers
+  (new_game, claim, challenge, ...), e.g.
+
+    driver = LoadDriver(concurrency=200, rate=1000)
+    result = driver.run(lambda: self.new_game(data=game) for _ in xrange(10000))
+  """
+  def __init__(self, concurrency=20, rate=None):
+    """
+    :param concurrency: number of requests in flight
+    :param rate: target of requests per second, None to go as fast as possible
+    """
+    self.concurrency = concurrency
+    self.rate = rate
+
+  def run(self, tasks):
+    """
+    Execute all the tasks and wait for them to finish.
+    :param tasks: iterable of callables, it is consumed lazily by the load threads
+    :return: LoadResult with the value returned by every task and the exceptions raised
+    """
+    result = LoadResult()
+    tasks = iter(tasks)
+    tasks_lock = threading.Lock()
+    pacer = Pacer(self.rate) if self.rate else None
+    # Every thread fills its own buffer, they are merged once all the threads end
+    buffers = [LoadResult() for _ in xrange(self.concurrency)]
+
+    def worker(buffer):
+      while True:
+        with tasks_lock:
+          task = next(tasks, None)
+        if task is None:
+          return
+        if pacer is not None:
+          pacer.wait()
+        start = time.time()
+        try:
+          buffer.results.append(task())
+        except Exception as e:
+          buffer.errors.append(e)
+        buffer.latencies.record(time.time() - start)
+
+    threads = [threading.Thread(target=worker, args=(buffer,)) for buffer in buffers]
+    LOG.debug("Starting %s load threads, rate: %s" % (self.concurrency, self.rate))
+    result.start = time.time()
+    # The stack size is applied when the thread starts
+    previous_stack_size = threading.stack_size(THREAD_STACK_SIZE)
+    try:
+      for thread in threads:
+        thread.daemon = True
+        thread.start()
+    finally:
+      threading.stack_size(previous_stack_size)
+    for thread in threads:
+      thread.join()
+    result.end = time.time()
+    for buffer in buffers:
+      result.merge(buffer)
+    return result
+
+
+def constant_arrivals(rate, duration):
+  """
+  Send times of a constant arrival rate.
+  :param rate: requests per second
+  :param duration: seconds
+  :return: generator of offsets in seconds from the start of the run
+  """
+  for n in xrange(int(rate * duration)):
+    yield n / float(rate)
+
+
+def ramp_arrivals(start_rate, end_rate, duration):
+  """
+  Send times of an arrival rate that grows (or decreases) linearly.
+  :param start_rate: requests per second at the beginning
+  :param end_rate: requests per second at the end
+  :param duration: seconds
+  :return: generator of offsets in seconds from the start of the run
+  """
+  # Requests sent up to t: start_rate * t + a * t ** 2, we invert it for every request
+  a = (end_rate - start_rate) / (2.0 * duration)
+  for n in xrange(int((start_rate + end_rate) * duration / 2.0)):
+    if a == 0:
+      yield n / float(start_rate)
+    else:
+      yield (math.sqrt(start_rate ** 2 + 4 * a * n) - start_rate) / (2 * a)
+
+
+class OpenLoopScheduler(object):
+  """
+  Sends requests at the times of an arrival schedule no matter how long the previous
+  requests take, as the users of the server do. The latency of every request is measured
+  from the time it should have been sent, so the time it waited for a free thread when
+  the server falls behind is included (no coordinated omission).
+
+    scheduler = OpenLoopScheduler(ramp_arrivals(500, 5000, 60))
+    result = scheduler.run(itertools.repeat(lambda: self.new_game(data=game)))
+  """
+  def __init__(self, arrivals, max_in_flight=1000, observer=None):
+    """
+    :param arrivals: iterable of send times in seconds from the start of the run
+    :param max_in_flight: number of threads sending the requests
+    :param observer: callable(intended_time, latency, error) called when every task ends,
+    e.g. to follow the run while it happens
+    """
+    self.arrivals = arrivals
+    self.max_in_flight = max_in_flight
+    self.observer = observer
+
+  def run(self, tasks):
+    """
+    Execute the tasks following the arrival schedule and wait for them to finish.
+    :param tasks: iterable of callables, the run stops when either the tasks or
+    the arrivals are exhausted
+    :return: LoadResult
+    """
+    result = LoadResult()
+    pending = Queue.Queue()
+    buffers = [LoadResult() for _ in xrange(self.max_in_flight)]
+
+    def worker(buffer):
+      while True:
+        item = pending.get()
+        if item is None:
+          return
+        intended_time, task = item
+        error = None
+        try:
+          buffer.results.append(task())
+        except Exception as e:
+          error = e
+          buffer.errors.append(e)
+        latency = time.time() - intended_time
+        buffer.latencies.record(latency)
+        if self.observer is not None:
+          self.observer(intended_time, latency, error is not None)
+
+    threads = [threading.Thread(target=worker, args=(buffer,)) for buffer in buffers]
+    previous_stack_size = threading.stack_size(THREAD_STACK_SIZE)
+    try:
+      for thread in threads:
+        thread.daemon = True
+        thread.start()
+    finally:
+      threading.stack_size(previous_stack_size)
+    LOG.debug("Started %s open loop threads" % self.max_in_flight)
+    result.start = time.time()
+    for offset, task in itertools.izip(self.arrivals, tasks):
+      intended_time = result.start + offset
+      delay = intended_time - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      pending.put((intended_time, task))
+    for _ in threads:
+      pending.put(None)
+    for thread in threads:
+      thread.join()
+    result.end = time.time()
+    for buffer in buffers:
+      result.merge(buffer)
+    return result
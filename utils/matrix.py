@@ -0,0 +1,102 @@
+import collections
+import csv
+import itertools
+import logging
+from utils import capacity
+from utils.histogram import PERCENTILES
+
+LOG = logging.getLogger(__name__)
+
+ENDPOINTS = ("create_game", "get_game")
+COLUMNS = (["endpoint", "concurrency", "keep_alive", "num_players", "num_dice", "operations",
+            "errors", "duration", "throughput", "error_rate", "efficiency", "mean"] +
+           ["p%s" % percentile for percentile in PERCENTILES] + ["max"])
+# Columns that identify a curve, its points differ in the concurrency
+SERIES = ("endpoint", "keep_alive", "num_players", "num_dice")
+
+
+def parse_sizes(value):
+  """
+  :param value: comma separated game sizes as <numPlayers>x<numDice>, e.g. 2x5,10x5
+  :return: list of (numPlayers, numDice)
+  """
+  sizes = list()
+  for size in value.split(","):
+    players, _, dice = size.partition("x")
+    try:
+      sizes.append((int(players), int(dice)))
+    except ValueError:
+      raise ValueError("Invalid game size %r, expected <numPlayers>x<numDice>" % size)
+  return sizes
+
+
+def parse_keep_alive(value):
+  """
+  :param value: comma separated on and off
+  :return: list of booleans
+  """
+  switches = {"on": True, "off": False}
+  try:
+    return [switches[switch.strip().lower()] for switch in value.split(",")]
+  except KeyError:
+    raise ValueError("Invalid keep-alive %r, expected on, off or on,off" % value)
+
+
+def cells(endpoints, keep_alive, sizes, concurrency):
+  """
+  :return: list of (endpoint, keep_alive, (numPlayers, numDice), concurrency), the cells of a
+  curve are consecutive and go from the lowest concurrency to the highest
+  """
+  return list(itertools.product(endpoints, keep_alive, sizes, sorted(concurrency)))
+
+
+def row(endpoint, concurrency, keep_alive, size, result):
+  """
+  :param size: (numPlayers, numDice)
+  :param result: utils.load.LoadResult of the cell
+  :return: dict with the COLUMNS of the cell, but the efficiency
+  """
+  operations = result.latencies.count
+  errors = len(result.errors)
+  summary = result.latencies.summary()
+  summary.pop("count")
+  summary.update(endpoint=endpoint, concurrency=concurrency, keep_alive=keep_alive,
+                 num_players=size[0], num_dice=size[1], operations=operations, errors=errors,
+                 duration=result.duration, throughput=result.throughput,
+                 error_rate=errors / float(operations) if operations else 0.0)
+  return summary
+
+
+def curves(rows):
+  """
+  Group the rows by curve and add the scaling efficiency of every point: its throughput
+  divided by the throughput of the lowest concurrency scaled linearly.
+  :param rows: rows returned by row()
+  :return: list of dicts with the SERIES columns, the points sorted by concurrency and the
+  knee, the concurrency with the highest throughput per second of latency
+  """
+  series = collections.OrderedDict()
+  for point in rows:
+    series.setdefault(tuple(point[key] for key in SERIES), list()).append(point)
+  result = list()
+  for key, points in series.items():
+    points.sort(key=lambda point: point["concurrency"])
+    base = points[0]
+    for point in points:
+      linear = base["throughput"] * point["concurrency"] / float(base["concurrency"])
+      point["efficiency"] = point["throughput"] / linear if linear else 0.0
+    curve = dict(zip(SERIES, key))
+    curve["points"] = [dict((column, point[column]) for column in COLUMNS
+                            if column not in SERIES) for point in points]
+    curve["knee"] = capacity.knee([dict(point, load=point["concurrency"])
+                                   for point in points])
+    result.append(curve)
+  return result
+
+
+def write_csv(rows, path):
+  with open(path, "wb") as f:
+    writer = csv.DictWriter(f, COLUMNS)
+    writer.writeheader()
+    for point in rows:
+      writer.writerow(dict((column, point.get(column)) for column in COLUMNS))
@@ -0,0 +1,243 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+# States of /proc/net/tcp
+TCP_STATES = {
+  "01": "established",
+  "02": "syn_sent",
+  "03": "syn_recv",
+  "04": "fin_wait1",
+  "05": "fin_wait2",
+  "06": "time_wait",
+  "07": "close",
+  "08": "close_wait",
+  "09": "last_ack",
+  "0A": "listen",
+  "0B": "closing",
+}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class ResourceSampler(object):
+  """
+  Poll the resources of a local server process and its children from /proc at a fixed
+  interval: CPU, RSS, threads, page faults, context switches, open file descriptors and the
+  states of its TCP sockets. It runs in a daemon thread.
+
+    sampler = ResourceSampler(pid, interval=1.0, port=8080)
+    sampler.start()
+    ...
+    samples = sampler.stop()
+  """
+  def __init__(self, pid, interval=1.0, port=None):
+    """
+    :param pid: process id of the server
+    :param interval: seconds between samples
+    :param port: port of the server, the sockets on it without owner (time_wait) are counted
+    """
+    self.pid = pid
+    self.interval = interval
+    self.port = port
+    self.samples = list()
+    self.stopped = threading.Event()
+    self.thread = None
+    self.previous = None
+
+  def start(self):
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    """
+    :return: list of the samples taken
+    """
+    self.stopped.set()
+    if self.thread is not None:
+      self.thread.join()
+    return self.samples
+
+  def run(self):
+    next_time = time.time()
+    while not self.stopped.is_set():
+      try:
+        sample = self.sample()
+      except (IOError, OSError) as e:
+        LOG.warning("Stopped sampling process %s: %s" % (self.pid, e))
+        return
+      if sample is not None:
+        self.samples.append(sample)
+      next_time += self.interval
+      self.stopped.wait(max(0, next_time - time.time()))
+
+  def sample(self):
+    """
+    :return: dict with the resources used, cpu is the number of cores busy. None for the
+    first call since the CPU is measured as the difference with the previous sample
+    :raises IOError or OSError if the process is gone
+    """
+    now = time.time()
+    totals = collections.Counter()
+    ticks = dict()
+    sockets = dict()
+    for pid in self.processes():
+      try:
+        with open("/proc/%s/stat" % pid) as f:
+          # The command name can contain spaces, the fields start after its closing parenthesis
+          fields = f.read().rsplit(")", 1)[1].split()
+        switches = self.context_switches(pid)
+        inodes = self.socket_inodes(pid)
+      except (IOError, OSError):
+        if pid == self.pid:
+          raise
+        # A child that exited since the children were listed
+        continue
+      ticks[pid] = int(fields[11]) + int(fields[12])
+      totals.update(threads=int(fields[17]), rss=int(fields[21]) * PAGE_SIZE,
+                    major_faults=int(fields[9]), fds=inodes.pop(None), processes=1)
+      totals.update(switches)
+      sockets.update(inodes)
+    previous, self.previous = self.previous, (now, ticks)
+    if previous is None:
+      return None
+    # Per process, so the ticks of the children that exited aren't subtracted, and the ones
+    # started since the previous sample count from their start
+    used = sum(max(0, value - previous[1].get(pid, 0)) for pid, value in ticks.items())
+    sample = dict(totals, time=now, cpu=used / float(CLOCK_TICKS) / (now - previous[0]))
+    sample.update(self.socket_states(sockets))
+    return sample
+
+  def processes(self):
+    """
+    :return: pids of the process and its children, e.g. the workers of the local server
+    """
+    try:
+      with open("/proc/%s/task/%s/children" % (self.pid, self.pid)) as f:
+        return [self.pid] + f.read().split()
+    except IOError:
+      return [self.pid]
+
+  def context_switches(self, pid):
+    switches = dict()
+    with open("/proc/%s/status" % pid) as f:
+      for line in f:
+        if line.startswith("voluntary_ctxt_switches"):
+          switches["voluntary_switches"] = int(line.split()[1])
+        elif line.startswith("nonvoluntary_ctxt_switches"):
+          switches["involuntary_switches"] = int(line.split()[1])
+    return switches
+
+  def socket_inodes(self, pid):
+    """
+    :return: dict with the inodes of the sockets of the process and the number of file
+    descriptors under None
+    """
+    directory = "/proc/%s/fd" % pid
+    inodes = {None: 0}
+    for fd in os.listdir(directory):
+      inodes[None] += 1
+      try:
+        target = os.readlink(os.path.join(directory, fd))
+      except OSError:
+        # Closed since the directory was listed
+        continue
+      if target.startswith("socket:["):
+        inodes[target[8:-1]] = True
+    return inodes
+
+  def socket_states(self, inodes):
+    """
+    :param inodes: inodes of the sockets of the process
+    :return: dict with the number of sockets in every state, e.g. tcp_established
+    """
+    states = dict(("tcp_%s" % state, 0) for state in TCP_STATES.values())
+    port = "%04X" % self.port if self.port else None
+    for name in ("tcp", "tcp6"):
+      try:
+        f = open("/proc/%s/net/%s" % (self.pid, name))
+      except IOError:
+        continue
+      with f:
+        next(f)
+        for line in f:
+          fields = line.split()
+          local_port = fields[1].rsplit(":", 1)[1]
+          if fields[9] in inodes or (port is not None and local_port == port):
+            key = "tcp_%s" % TCP_STATES.get(fields[3], "unknown")
+            states[key] = states.get(key, 0) + 1
+    return states
+
+
+def rss(pid="self"):
+  """
+  :return: bytes of resident memory of a process
+  """
+  with open("/proc/%s/statm" % pid) as f:
+    return int(f.read().split()[1]) * PAGE_SIZE
+
+
+class PeakRss(object):
+  """
+  Highest resident memory of a process while a block runs, polled from a daemon thread.
+
+    with PeakRss() as memory:
+      games = r.json()
+    LOG.info(memory.growth)
+  """
+  def __init__(self, pid="self", interval=0.005):
+    """
+    :param pid: process id, the current process by default
+    :param interval: seconds between the polls
+    """
+    self.pid = pid
+    self.interval = interval
+    self.start = self.peak = None
+    self.stopped = threading.Event()
+    self.thread = None
+
+  def __enter__(self):
+    self.start = self.peak = rss(self.pid)
+    self.stopped.clear()
+    self.thread = threading.Thread(target=self.run)
+    self.thread.daemon = True
+    self.thread.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stopped.set()
+    self.thread.join()
+    self.peak = max(self.peak, rss(self.pid))
+
+  def run(self):
+    while not self.stopped.wait(self.interval):
+      self.peak = max(self.peak, rss(self.pid))
+
+  @property
+  def growth(self):
+    """
+    :return: bytes the peak went over the memory at the start of the block
+    """
+    return self.peak - self.start
+
+
+def align(windows, samples, interval):
+  """
+  Join the client latency windows with the server samples taken in them.
+  :param windows: rows of utils.benchmark.Timeline, with their start time
+  :param samples: samples of a ResourceSampler
+  :param interval: seconds of the windows
+  :return: list of rows sorted by time
+  """
+  rows = dict((int(window["time"] // interval), dict(window)) for window in windows)
+  for sample in samples:
+    # The cpu of a sample was used since the previous one, its middle point is used
+    index = int((sample["time"] - interval / 2.0) // interval)
+    row = rows.setdefault(index, {"time": index * interval})
+    row.update((key, value) for key, value in sample.items() if key != "time")
+  return [rows[index] for index in sorted(rows)]
@@ -0,0 +1,169 @@
+import importlib
+import json
+import logging
+
+LOG = logging.getLogger(__name__)
+
+# Decoders tried in order when the auto decoder is requested, the fastest first
+AUTO_DECODERS = ("ujson", "simplejson", "json")
+DECODERS = ("auto", ) + AUTO_DECODERS
+# Whitespace allowed between the tokens of a json document
+WHITESPACE = " \t\n\r"
+
+_decoders = dict()
+
+
+def get_decoder(name="auto"):
+  """
+  :param name: json module used to parse the responses, auto picks the fastest installed
+  :return: callable that parses a json document
+  :raises ImportError if the module isn't installed
+  """
+  if name not in _decoders:
+    if name == "auto":
+      for candidate in AUTO_DECODERS:
+        try:
+          _decoders[name] = get_decoder(candidate)
+          LOG.debug("Decoding json with %s" % candidate)
+          break
+        except ImportError:
+          continue
+    elif name in AUTO_DECODERS:
+      _decoders[name] = importlib.import_module(name).loads
+    else:
+      raise ValueError("Unknown json decoder %s, expected one of %s"
+                       % (name, ", ".join(DECODERS)))
+  return _decoders[name]
+
+
+def decode(r, decoder=json.loads):
+  """
+  Parse the json body of a response. Unlike requests.Response.json it doesn't guess the
+  encoding of the body, json is utf-8 and the parsers read the bytes directly.
+  :param r: requests.Response
+  :param decoder: callable returned by get_decoder
+  :raises ValueError if the body isn't valid json
+  """
+  return decoder(r.content)
+
+
+def iter_array(chunks):
+  """
+  Parse a json array incrementally, every item is yielded as soon as it has been read so
+  only the current item and the unparsed bytes are kept in memory. The stdlib decoder is
+  used since it's the one that can parse a document from the middle of a buffer.
+  :param chunks: iterable of the str chunks of the body, e.g. r.iter_content(65536)
+  :return: generator of the items
+  :raises ValueError if the body isn't a valid json array
+  """
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  buffer = ""
+  position = 0
+  # What can come next: the opening [, an item or the closing ] (]), an item after a comma
+  # (item) or a comma or the closing ] after an item (,])
+  expected = "["
+  finished = False
+  while True:
+    while position < len(buffer) and buffer[position] in WHITESPACE:
+      position += 1
+    if position == len(buffer):
+      if finished:
+        raise ValueError("The json array ended unexpectedly.")
+      buffer, position, finished = _read(chunks, buffer, position)
+      continue
+    character = buffer[position]
+    if expected == "[":
+      if character != "[":
+        raise ValueError("The json body isn't an array: %r" % buffer[position:position + 20])
+      position += 1
+      expected = "]"
+    elif character == "]" and expected in ("]", ",]"):
+      return
+    elif character == "," and expected == ",]":
+      position += 1
+      expected = "item"
+    elif expected in ("]", "item"):
+      try:
+        item, end = decoder.raw_decode(buffer, position)
+      except ValueError:
+        if finished:
+          raise
+        buffer, position, finished = _read(chunks, buffer, position)
+        continue
+      # A number cut by the end of the chunk is parsed again with the next one
+      if not finished and (end == len(buffer) or buffer[end] not in WHITESPACE + ",]"):
+        buffer, position, finished = _read(chunks, buffer, position)
+        continue
+      position = end
+      expected = ",]"
+      yield item
+    else:
+      raise ValueError("Unexpected %r in the json array." % character)
+
+
+def _read(chunks, buffer, position):
+  """
+  :return: the unparsed part of the buffer with the next chunk appended, its position and
+  whether the body has been read entirely
+  """
+  for chunk in chunks:
+    if chunk:
+      return buffer[position:] + chunk, 0, False
+  return buffer[position:], 0, True
+
+
+class Schema(object):
+  """
+  Validator of the json body of a response. The checks are prepared when the schema is built,
+  validating a body is a subset test of its keys, plus an isinstance per field when strict.
+
+    GAME = Schema("game", {"_id": basestring, "numDice": int, ...})
+    GAME.validate(json_body)
+  """
+  def __init__(self, name, fields=None, types=None):
+    """
+    :param name: name of the response used in the error messages
+    :param fields: dict with the type (or tuple of types) of every required key of an object
+    :param types: type (or tuple of types) of the body when it isn't an object
+    """
+    self.name = name
+    self.required = frozenset(fields or ())
+    self.checks = tuple((fields or {}).items())
+    self.types = types if types is not None else dict
+
+  def validate(self, body, strict=False):
+    """
+    :param strict: check the types of the body and its fields, otherwise only the keys of
+    an object are checked
+    :raises ValueError if the body doesn't follow the schema
+    """
+    if not self.checks:
+      if strict and not isinstance(body, self.types):
+        raise ValueError("The %s response isn't a %s: %r" % (self.name, self.types, body))
+      return
+    if not isinstance(body, dict):
+      raise ValueError("The %s response isn't an object: %r" % (self.name, body))
+    if not self.required.issubset(body):
+      missing = ", ".join(sorted(self.required.difference(body)))
+      raise ValueError("Keys %s weren't available in the %s response." % (missing, self.name))
+    if not strict:
+      return
+    for key, types in self.checks:
+      if not isinstance(body[key], types):
+        raise ValueError("Key '%s' of the %s response should be %s: %r"
+                         % (key, self.name, types, body[key]))
+
+
+GAME = Schema("game", {
+  "_id": basestring,
+  "numDice": (int, long),
+  "numPlayers": (int, long),
+  "board": list,
+  "actions": list,
+  "playerHands": list,
+})
+# A claim answers with the state of the game after it
+CLAIM = Schema("claim", dict(GAME.checks))
+# A challenge answers whether the claim was right
+CHALLENGE = Schema("challenge", types=bool)
@@ -0,0 +1,846 @@
+import argparse
+import collections
+import email.utils
+import errno
+import heapq
+import httplib
+import itertools
+import json
+import logging
+import marshal
+import multiprocessing
+import random
+import select
+import signal
+import socket
+import struct
+import sys
+import time
+from urlparse import urlparse, parse_qs
+
+LOG = logging.getLogger(__name__)
+
+FACES = 6
+VALID_DICE = 5
+MAX_PLAYERS = 100
+MAX_INT_LENGTH = 20
+# Largest page of games returned by list
+MAX_PAGE_SIZE = 10000
+# Longest request line and headers, and longest line of a chunked body
+MAX_HEADER_LENGTH = 65536
+SERVER_VERSION = "LiarDiceStandIn/0.2"
+# Bytes read from a socket at once
+RECV_SIZE = 65536
+# Connections taken from the listening socket every time it is ready
+ACCEPT_BATCH = 64
+# Seconds the input of a closing connection is read, so the client gets the last response
+LINGER_SECONDS = 1.0
+# Length prefix of the messages between workers
+FRAME = struct.Struct("!I")
+READ = select.POLLIN | select.POLLPRI
+WRITE = select.POLLOUT
+AGAIN = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+class GameError(Exception):
+  """
+  Invalid request, it is answered with an error body
+  """
+  pass
+
+
+class BodyError(Exception):
+  """
+  The body of a request can't be read, the connection is closed after answering it
+  """
+  def __init__(self, status, message):
+    super(BodyError, self).__init__(message)
+    self.status = status
+
+
+class Game(object):
+  """
+  In memory game, hands are kept in bytearrays to keep the memory of every game small.
+  """
+  __slots__ = ("id", "num_players", "num_dice", "hands", "board", "actions", "bid", "version")
+
+  def __init__(self, id, num_players, num_dice, rng):
+    self.id = id
+    self.num_players = num_players
+    self.num_dice = num_dice
+    self.hands = [bytearray(rng.randint(1, FACES) for _ in xrange(num_dice))
+                  for _ in xrange(num_players)]
+    self.board = bytearray()
+    self.actions = []
+    # Current bid of the round (player, number, face)
+    self.bid = None
+    # Changes with every action, it is part of the ETag
+    self.version = 0
+
+  def to_json(self):
+    return {
+      "_id": self.id,
+      "numPlayers": self.num_players,
+      "numDice": self.num_dice,
+      "board": list(self.board),
+      "actions": self.actions,
+      "playerHands": [list(hand) for hand in self.hands],
+    }
+
+  def etag(self):
+    return '"%s-%s"' % (self.id, self.version)
+
+  def players_left(self):
+    return sum(1 for hand in self.hands if hand)
+
+  def claim(self, data, rng):
+    player = player_arg(self, data)
+    if not self.hands[player]:
+      raise GameError("Player %s already lost." % player)
+    if self.players_left() < 2:
+      raise GameError("Game already finished.")
+    action = {"player": player}
+    if "moveNumber" in data or "moveFace" in data:
+      move_number = int_arg(data, "moveNumber", 1, len(self.hands[player]))
+      move_face = int_arg(data, "moveFace", 1, FACES)
+      if count(self.hands[player], move_face) < move_number:
+        raise GameError("Player %s doesn't have %s dice of face %s."
+                        % (player, move_number, move_face))
+      action["moveNumber"] = move_number
+      action["moveFace"] = move_face
+    if "claimNumber" in data or "claimFace" in data:
+      claim_number = int_arg(data, "claimNumber", 1, self.total_dice())
+      claim_face = int_arg(data, "claimFace", 1, FACES)
+      if self.bid is not None and (claim_number, claim_face) <= self.bid[1:]:
+        raise GameError("Claim must be higher than the current claim.")
+      action["claimNumber"] = claim_number
+      action["claimFace"] = claim_face
+    if len(action) == 1:
+      raise GameError("Claim without a move or a bid.")
+    if "moveNumber" in action:
+      hand = self.hands[player]
+      for _ in xrange(action["moveNumber"]):
+        hand.remove(action["moveFace"])
+        self.board.append(action["moveFace"])
+      # Dice left in the hand get re-rolled after moving dice to the center
+      self.hands[player] = bytearray(rng.randint(1, FACES) for _ in xrange(len(hand)))
+    if "claimNumber" in action:
+      self.bid = (player, action["claimNumber"], action["claimFace"])
+    self.actions.append(action)
+    self.version += 1
+    return self.to_json()
+
+  def challenge(self, data):
+    player = player_arg(self, data)
+    if self.bid is None:
+      raise GameError("There is no claim to challenge.")
+    claimant, number, face = self.bid
+    found = count(self.board, face) + sum(count(hand, face) for hand in self.hands)
+    correct = found >= number
+    # The challenger loses a die when the claim was right, the claimant otherwise
+    loser = player if correct else claimant
+    if self.hands[loser]:
+      self.hands[loser].pop()
+    self.actions.append({"player": player, "challenge": claimant, "result": correct})
+    self.bid = None
+    self.version += 1
+    return correct
+
+  def total_dice(self):
+    return len(self.board) + sum(len(hand) for hand in self.hands)
+
+
+def count(dice, face):
+  """
+  :return: number of dice with the face
+  """
+  return dice.count(bytearray((face, )))
+
+
+def int_arg(data, key, minimum, maximum):
+  """
+  Parse an integer argument of a request, form values arrive as strings.
+  :param data: body of the request
+  :param key: name of the argument
+  :param minimum: lowest valid value
+  :param maximum: highest valid value
+  :return: int
+  :raises GameError if the argument is missing or invalid
+  """
+  if key not in data:
+    raise GameError("Missing %s." % key)
+  value = data[key]
+  # Converting a long string of digits takes quadratic time, no valid argument is that long
+  if isinstance(value, basestring) and len(value) > MAX_INT_LENGTH:
+    raise GameError("%s must be an integer." % key)
+  try:
+    if isinstance(value, float) or int(value) != float(value):
+      raise ValueError()
+    value = int(value)
+  except (TypeError, ValueError, OverflowError):
+    raise GameError("%s must be an integer." % key)
+  if value < minimum or value > maximum:
+    raise GameError("%s must be between %s and %s." % (key, minimum, maximum))
+  return value
+
+
+def player_arg(game, data):
+  return int_arg(data, "player", 0, game.num_players - 1)
+
+
+def page_args(query):
+  """
+  :param query: arguments of a list request
+  :return: (skip, limit), limit is None to list every game after skip
+  """
+  skip = int_arg(query, "skip", 0, MAX_PAGE_SIZE * 1000000) if "skip" in query else 0
+  limit = int_arg(query, "limit", 1, MAX_PAGE_SIZE) if "limit" in query else None
+  return skip, limit
+
+
+def owner(id):
+  """
+  :return: index of the worker that owns the game, None if the id isn't one of ours
+  """
+  if len(id) != 16:
+    return None
+  try:
+    return int(id[:2], 16)
+  except ValueError:
+    return None
+
+
+def shared_sequence():
+  """
+  :return: callable returning the next number of a counter shared by the forked workers
+  """
+  value = multiprocessing.Value("L", 0)
+  def next_number():
+    with value.get_lock():
+      value.value += 1
+      return value.value
+  return next_number
+
+
+class GameStore(object):
+  """
+  Keeps the games of a worker in memory. The ids are the index of the worker followed by a
+  counter shared by every worker, so they are compact and unique, tell the worker that owns
+  the game and sort the games of all the workers in creation order.
+  """
+  def __init__(self, seed=None, worker=0, sequence=None):
+    self.worker = worker
+    self.games = {}
+    # Games by creation order, the pages of list are slices of it
+    self.ordered = []
+    self.sequence = sequence or itertools.count(1).next
+    self.rng = random.Random(seed if seed is None else (seed, worker))
+
+  def create(self, data):
+    num_players = int_arg(data, "numPlayers", 1, MAX_PLAYERS)
+    num_dice = int_arg(data, "numDice", VALID_DICE, VALID_DICE)
+    id = "%02x%014x" % (self.worker, self.sequence())
+    game = Game(id, num_players, num_dice, self.rng)
+    self.games[id] = game
+    self.ordered.append(game)
+    return game.to_json()
+
+  def get(self, id):
+    try:
+      return self.games[id]
+    except KeyError:
+      raise GameError("Game %s not found." % id)
+
+  def list(self, skip=0, limit=None):
+    """
+    :param skip: games skipped in creation order
+    :param limit: games returned, every game after skip if None
+    :return: list of games
+    """
+    return [game.to_json() for game in self.ordered[skip:skip + limit if limit else None]]
+
+  def oldest(self, count=None):
+    """
+    :param count: number of games, every game if None
+    :return: list of (number, game) of the oldest games, the number sorts the games of
+    every worker in creation order
+    """
+    return [(int(game.id[2:], 16), game.to_json()) for game in self.ordered[:count]]
+
+  def execute(self, operation):
+    """
+    Run an operation on the games of this worker, the other workers send theirs as messages.
+    :param operation: tuple with the name of the operation and its arguments
+    :return: (status, headers, body) of the response
+    """
+    name, args = operation[0], operation[1:]
+    try:
+      if name == "create":
+        return 200, {}, self.create(*args)
+      if name == "oldest":
+        return 200, {}, self.oldest(*args)
+      game = self.get(args[0])
+      if name == "get":
+        etag = game.etag()
+        if args[1] == etag:
+          return 304, {"ETag": etag}, None
+        return 200, {"ETag": etag}, game.to_json()
+      if name == "claim":
+        return 200, {}, game.claim(args[1], self.rng)
+      return 200, {}, game.challenge(args[1])
+    except GameError as e:
+      # The reference server answers errors with a 200 and an error body
+      return 200, {}, {"error": str(e)}
+    except Exception:
+      LOG.exception("Failed to run %s" % name)
+      return 500, {}, {"error": "Internal server error."}
+
+
+def parse_body(headers, body):
+  """
+  :return: dict with the arguments of a form or json body
+  """
+  if not body:
+    return {}
+  if headers.get("content-type", "").startswith("application/json"):
+    try:
+      data = json.loads(body)
+    except ValueError:
+      return {}
+    return data if isinstance(data, dict) else {}
+  return dict((key, values[-1]) for key, values in parse_qs(body).items())
+
+
+def read_chunks(data, position):
+  """
+  :param data: bytes received on a connection
+  :param position: start of a chunked body in data
+  :return: (body, end of the body in data), None if data doesn't have the whole body yet
+  :raises BodyError if the body is malformed
+  """
+  chunks = list()
+  while True:
+    end = data.find("\r\n", position)
+    if end < 0:
+      if len(data) - position > MAX_HEADER_LENGTH:
+        raise BodyError(400, "Invalid chunk size.")
+      return None
+    try:
+      size = int(data[position:end].split(";", 1)[0], 16)
+      if size < 0:
+        raise ValueError()
+    except ValueError:
+      raise BodyError(400, "Invalid chunk size.")
+    position = end + 2
+    if size == 0:
+      break
+    if len(data) < position + size + 2:
+      return None
+    chunks.append(data[position:position + size])
+    position += size + 2
+  # Trailers end with an empty line
+  while True:
+    end = data.find("\r\n", position)
+    if end < 0:
+      return None
+    line, position = data[position:end], end + 2
+    if not line:
+      return "".join(chunks), position
+
+
+class WorkerStopped(Exception):
+  pass
+
+
+class Channel(object):
+  """
+  Non-blocking socket registered in the poller of a worker, with the output that didn't fit
+  in the socket buffer yet.
+  """
+  def __init__(self, sock, worker):
+    self.sock = sock
+    self.fd = sock.fileno()
+    self.worker = worker
+    self.input = ""
+    self.output = collections.deque()
+    self.offset = 0
+    self.writing = False
+    self.closed = False
+    worker.register(self)
+
+  def receive(self):
+    """
+    :return: bytes received, "" once the other end closed, None if there are none yet
+    """
+    try:
+      return self.sock.recv(RECV_SIZE)
+    except socket.error as e:
+      if e.errno in AGAIN or e.errno == errno.EINTR:
+        return None
+      return ""
+
+  def write(self, data):
+    self.output.append(data)
+    self.flush()
+
+  def flush(self):
+    while self.output and not self.closed:
+      try:
+        sent = self.sock.send(buffer(self.output[0], self.offset))
+      except socket.error as e:
+        if e.errno in AGAIN:
+          break
+        if e.errno == errno.EINTR:
+          continue
+        return self.close()
+      self.offset += sent
+      if self.offset == len(self.output[0]):
+        self.output.popleft()
+        self.offset = 0
+    if self.closed:
+      return
+    writing = bool(self.output)
+    if writing != self.writing:
+      self.writing = writing
+      self.worker.poller.modify(self.fd, READ | WRITE if writing else READ)
+    if not writing:
+      self.flushed()
+
+  def flushed(self):
+    pass
+
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    self.worker.unregister(self)
+    self.sock.close()
+
+
+class Connection(Channel):
+  """
+  HTTP/1.1 connection of a client. The requests may be pipelined, their responses are sent
+  in the same order even when the games of other workers answer them out of order.
+  """
+  def __init__(self, sock, worker):
+    super(Connection, self).__init__(sock, worker)
+    # Responses by request order, None until the request is answered
+    self.responses = collections.deque()
+    # No more requests are read, the connection is closed after the last response
+    self.closing = False
+    self.linger_deadline = None
+
+  def readable(self):
+    data = self.receive()
+    if data is None:
+      return
+    if not data:
+      return self.close()
+    if self.closing:
+      return
+    self.input += data
+    self.parse()
+
+  def parse(self):
+    while not self.closing:
+      # Clients may send empty lines between requests
+      self.input = self.input.lstrip("\r\n")
+      end = self.input.find("\r\n\r\n")
+      if end < 0:
+        if len(self.input) > MAX_HEADER_LENGTH:
+          self.fail(431, "Request headers too large.")
+        return
+      lines = self.input[:end].split("\r\n")
+      request_line = lines[0].split()
+      if len(request_line) != 3 or not request_line[2].startswith("HTTP/"):
+        return self.fail(400, "Invalid request line.")
+      method, target, version = request_line
+      headers = dict()
+      for line in lines[1:]:
+        name, colon, value = line.partition(":")
+        if not colon:
+          return self.fail(400, "Invalid header.")
+        headers[name.strip().lower()] = value.strip()
+      try:
+        body = self.read_body(method, headers, end + 4)
+      except BodyError as e:
+        return self.fail(e.status, str(e))
+      if body is None:
+        return
+      connection = headers.get("connection", "").lower()
+      if version == "HTTP/1.0":
+        keep_alive = "keep-alive" in connection
+      else:
+        keep_alive = "close" not in connection
+      self.worker.handle(self, method, target, headers, body, keep_alive)
+
+  def read_body(self, method, headers, position):
+    """
+    Take the request whose headers end at position out of the input.
+    :return: the body, None if the input doesn't have the whole body yet
+    :raises BodyError if the length of the body is unknown or invalid
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+      chunked = read_chunks(self.input, position)
+      if chunked is None:
+        return None
+      body, end = chunked
+    elif "content-length" in headers:
+      try:
+        length = int(headers["content-length"])
+        if length < 0:
+          raise ValueError()
+      except ValueError:
+        raise BodyError(400, "Invalid Content-Length.")
+      end = position + length
+      if len(self.input) < end:
+        return None
+      body = self.input[position:end]
+    elif method == "POST":
+      # requests sends a form that encodes to nothing as an empty chunked body, but without
+      # the Transfer-Encoding header
+      raise BodyError(411, "Length required.")
+    else:
+      body, end = "", position
+    self.input = self.input[end:]
+    return body
+
+  def fail(self, status, message):
+    """
+    Answer a request that can't be read and close the connection, the rest of the input
+    can't be told apart from the next request.
+    """
+    self.input = ""
+    self.expect(False)(status, {}, {"error": message})
+
+  def expect(self, keep_alive):
+    """
+    Keep the place of the response of the next request.
+    :return: callable(status, headers, body) that sends the response in its turn
+    """
+    response = [None]
+    self.responses.append(response)
+    if not keep_alive:
+      self.closing = True
+    def answer(status, headers, body):
+      response[0] = self.worker.response(status, headers, body, keep_alive)
+      self.send_ready()
+    return answer
+
+  def send_ready(self):
+    if self.closed:
+      return
+    ready = list()
+    while self.responses and self.responses[0][0] is not None:
+      ready.append(self.responses.popleft()[0])
+    if ready:
+      # Pipelined responses are sent together, and every response in a single write
+      self.write("".join(ready))
+
+  def flushed(self):
+    if not self.closing or self.responses or self.linger_deadline is not None:
+      return
+    try:
+      self.sock.shutdown(socket.SHUT_WR)
+    except socket.error:
+      return self.close()
+    # Closing a socket with unread input resets the connection and the client can lose the
+    # response, the input is read until the client closes
+    self.linger_deadline = time.time() + LINGER_SECONDS
+    self.worker.lingering.add(self)
+
+  def close(self):
+    super(Connection, self).close()
+    self.responses.clear()
+    self.worker.lingering.discard(self)
+
+
+class Peer(Channel):
+  """
+  Socket to another worker. The messages are marshalled tuples prefixed with their length:
+  ("call", id, operation) runs an operation on a game of the receiver and
+  ("reply", id, result) returns its result.
+  """
+  def readable(self):
+    data = self.receive()
+    if data is None:
+      return
+    if not data:
+      raise WorkerStopped("A worker stopped.")
+    self.input += data
+    while len(self.input) >= FRAME.size:
+      length, = FRAME.unpack_from(self.input)
+      end = FRAME.size + length
+      if len(self.input) < end:
+        return
+      message = marshal.loads(self.input[FRAME.size:end])
+      self.input = self.input[end:]
+      self.worker.receive(self, *message)
+
+  def send(self, *message):
+    data = marshal.dumps(message)
+    self.write(FRAME.pack(len(data)) + data)
+
+
+class Poll(object):
+  """
+  select.poll with the interface of select.epoll, for the platforms without epoll
+  """
+  def __init__(self):
+    self.poller = select.poll()
+    self.register = self.poller.register
+    self.modify = self.poller.modify
+    self.unregister = self.poller.unregister
+
+  def poll(self, timeout):
+    return self.poller.poll(timeout * 1000)
+
+
+class Worker(object):
+  """
+  Event loop of a worker process. Every worker accepts connections from the listening socket
+  shared by all of them and answers their requests. A game lives in the worker that created
+  it, the operations on the games of other workers are sent to them.
+  """
+  def __init__(self, listener, store, peers=None):
+    """
+    :param listener: non-blocking listening socket
+    :param store: GameStore of the worker
+    :param peers: dict with the socket to every other worker by index
+    """
+    self.listener = listener
+    self.store = store
+    self.poller = select.epoll() if hasattr(select, "epoll") else Poll()
+    self.channels = dict()
+    self.lingering = set()
+    # Callbacks of the operations sent to other workers by message id
+    self.calls = dict()
+    self.ids = itertools.count()
+    self.date = (None, None)
+    self.peers = dict((index, Peer(sock, self)) for index, sock in (peers or {}).items())
+
+  def register(self, channel):
+    self.channels[channel.fd] = channel
+    self.poller.register(channel.fd, READ)
+
+  def unregister(self, channel):
+    del self.channels[channel.fd]
+    self.poller.unregister(channel.fd)
+
+  def run(self):
+    listener = self.listener.fileno()
+    self.poller.register(listener, READ)
+    try:
+      while True:
+        for fd, events in self.poller.poll(LINGER_SECONDS):
+          if fd == listener:
+            self.accept()
+          else:
+            self.ready(fd, events)
+        if self.lingering:
+          now = time.time()
+          for connection in [c for c in self.lingering if c.linger_deadline < now]:
+            connection.close()
+    except WorkerStopped as e:
+      LOG.error(e)
+
+  def ready(self, fd, events):
+    channel = self.channels.get(fd)
+    try:
+      if channel is not None and events & WRITE:
+        channel.flush()
+      if not (channel is None or channel.closed) and events & ~WRITE:
+        channel.readable()
+    except WorkerStopped:
+      raise
+    except Exception:
+      # Only the connection is lost, the worker keeps answering the rest
+      LOG.exception("Closing connection %s" % fd)
+      channel.close()
+
+  def accept(self):
+    for _ in xrange(ACCEPT_BATCH):
+      try:
+        sock, _ = self.listener.accept()
+      except socket.error as e:
+        # Another worker took the connection, or there are no more
+        if e.errno not in AGAIN + (errno.EINTR, errno.ECONNABORTED):
+          LOG.error("Can't accept connections: %s" % e)
+        return
+      sock.setblocking(0)
+      sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      Connection(sock, self)
+
+  def handle(self, connection, method, target, headers, body, keep_alive):
+    answer = connection.expect(keep_alive)
+    url = urlparse(target)
+    path = [part for part in url.path.split("/") if part]
+    if method == "GET":
+      if not path:
+        return answer(200, {}, {"name": "Liar's Dice"})
+      if path == ["games"]:
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        return self.list(query, answer)
+      if len(path) == 2 and path[0] == "games":
+        return self.call(("get", path[1], headers.get("if-none-match")), answer)
+    elif method == "POST":
+      data = parse_body(headers, body)
+      if path == ["games"]:
+        return self.call(("create", data), answer)
+      if len(path) == 3 and path[0] == "games" and path[2] in ("claim", "challenge"):
+        return self.call((path[2], path[1], data), answer)
+    else:
+      return answer(501, {}, {"error": "Unsupported method %s." % method})
+    answer(404, {}, {"error": "Not found."})
+
+  def call(self, operation, answer):
+    """
+    Run an operation in the worker that owns its game.
+    :param operation: tuple for GameStore.execute
+    :param answer: callable(status, headers, body) called with the result
+    """
+    index = self.store.worker if operation[0] == "create" else owner(operation[1])
+    peer = self.peers.get(index)
+    if peer is None:
+      return answer(*self.store.execute(operation))
+    id = next(self.ids)
+    self.calls[id] = lambda result: answer(*result)
+    peer.send("call", id, operation)
+
+  def list(self, query, answer):
+    """
+    Answer a page of the games of every worker in creation order. Every worker sends its
+    oldest skip + limit games and the page is taken from their merge.
+    """
+    try:
+      skip, limit = page_args(query)
+    except GameError as e:
+      return answer(200, {}, {"error": str(e)})
+    if not self.peers:
+      return answer(200, {}, self.store.list(skip, limit))
+    count = skip + limit if limit else None
+    pages = [self.store.oldest(count)]
+    def gather(result):
+      pages.append(result[2])
+      if len(pages) == len(self.peers) + 1:
+        games = [game for _, game in heapq.merge(*pages)]
+        answer(200, {}, games[skip:count])
+    for peer in self.peers.values():
+      id = next(self.ids)
+      self.calls[id] = gather
+      peer.send("call", id, ("oldest", count))
+
+  def receive(self, peer, kind, id, payload):
+    if kind == "call":
+      return peer.send("reply", id, self.store.execute(payload))
+    self.calls.pop(id)(payload)
+
+  def response(self, status, headers, body, keep_alive):
+    """
+    :return: bytes of the response, its headers and body are sent in the same write so the
+    response doesn't wait for the delayed ACK of the client
+    """
+    # A 304 has no body
+    content = json.dumps(body) if status != 304 else ""
+    lines = ["HTTP/1.1 %s %s" % (status, httplib.responses.get(status, "")),
+             "Server: %s" % SERVER_VERSION,
+             "Date: %s" % self.http_date(),
+             "Content-Type: application/json",
+             "Content-Length: %s" % len(content)]
+    lines.extend("%s: %s" % header for header in headers.items())
+    if not keep_alive:
+      # Otherwise an HTTP/1.1 client expects to reuse the connection the server closes
+      lines.append("Connection: close")
+    lines.append("\r\n")
+    return "\r\n".join(lines) + content
+
+  def http_date(self):
+    now = int(time.time())
+    if self.date[0] != now:
+      self.date = (now, email.utils.formatdate(now, usegmt=True))
+    return self.date[1]
+
+
+def listen(address, backlog=1024):
+  listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  listener.bind(address)
+  listener.listen(backlog)
+  listener.setblocking(0)
+  return listener
+
+
+def serve(address, workers=1, seed=None):
+  """
+  Stand-in implementation of the Liar's Dice API, it allows to run and benchmark the tests
+  without an external service:
+
+    python -m utils.server --port 8080 --workers 4
+
+  Every worker is a process with an event loop, the first one runs in the calling process.
+  The workers are connected by socket pairs and stop when any of them does.
+  :param address: (host, port) the server listens on
+  :param workers: number of worker processes
+  :param seed: seed used to roll the dice
+  """
+  listener = listen(address)
+  sequence = shared_sequence() if workers > 1 else None
+  pairs = dict((pair, socket.socketpair())
+               for pair in itertools.combinations(xrange(workers), 2))
+  processes = list()
+  for index in xrange(1, workers):
+    process = multiprocessing.Process(target=run_worker,
+                                      args=(index, listener, pairs, seed, sequence))
+    process.daemon = True
+    process.start()
+    processes.append(process)
+  try:
+    run_worker(0, listener, pairs, seed, sequence)
+  finally:
+    for process in processes:
+      process.terminate()
+
+
+def run_worker(index, listener, pairs, seed, sequence):
+  """
+  Run the event loop of a worker with its ends of the socket pairs. The other ends are
+  closed, so a worker sees the others close when they stop.
+  """
+  peers = dict()
+  for (first, second), (left, right) in pairs.items():
+    if index == first:
+      peers[second] = left
+      right.close()
+    elif index == second:
+      peers[first] = right
+      left.close()
+    else:
+      left.close()
+      right.close()
+  for sock in peers.values():
+    sock.setblocking(0)
+  Worker(listener, GameStore(seed, index, sequence), peers).run()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--host", action="store", default="localhost", dest="host",
+                      help="Address the server listens on.")
+  parser.add_argument("--port", action="store", default=8080, dest="port", type=int,
+                      help="Port the server listens on.")
+  parser.add_argument("--seed", action="store", default=None, dest="seed", type=int,
+                      help="Seed used to roll the dice.")
+  parser.add_argument("--workers", action="store", default=1, dest="workers", type=int,
+                      help="Number of worker processes.")
+  args = parser.parse_args()
+  # The index of the worker is the first byte of the game ids
+  if not 1 <= args.workers <= 256:
+    parser.error("--workers must be between 1 and 256.")
+  logging.basicConfig(level=logging.INFO)
+  # Stop the other workers when terminated
+  signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+  LOG.info("Listening on %s:%s with %s workers" % (args.host, args.port, args.workers))
+  try:
+    serve((args.host, args.port), args.workers, args.seed)
+  except KeyboardInterrupt:
+    pass
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from utils.histogram import LatencyHistogram
+
+LOG = logging.getLogger(__name__)
+
+
+class WindowedMetrics(object):
+  """
+  Throughput, latency and error rate in consecutive windows of time. Every operation counts
+  in the window in which it started. A window stays open until the operations finish late
+  seconds after its end, then it is reduced to a summary so a run of hours uses little
+  memory. It is safe to use from several threads.
+  """
+  def __init__(self, window=60, start=None, late=None):
+    """
+    :param window: seconds per window
+    :param start: time of the beginning of the first window, now by default
+    :param late: seconds a window waits for the operations started in it, one window by
+    default. An operation finishing later is added to the operations and errors of its
+    window, and counted as late, but not to its latencies.
+    """
+    self.window = window
+    self.start = start if start is not None else time.time()
+    self.late = late if late is not None else window
+    self.windows = list()
+    # Histogram and errors of the open windows by index, the windows before are closed
+    self.open = dict()
+    self.lock = threading.Lock()
+
+  def _close(self, gauges):
+    index = len(self.windows)
+    latencies, errors = self.open.pop(index, (LatencyHistogram(), 0))
+    summary = latencies.summary()
+    summary.update(gauges)
+    summary["window"] = index
+    summary["start"] = self.start + index * self.window
+    summary["operations"] = latencies.count
+    summary["errors"] = errors
+    summary["late"] = 0
+    self._rates(summary)
+    self.windows.append(summary)
+    LOG.info("Window {window}: {throughput:.2f} ops/s, p50 {p50:.4f}s, p99 {p99:.4f}s, "
+             "{error_rate:.2%} errors".format(**summary))
+
+  def _rates(self, summary):
+    operations = summary["operations"]
+    summary["throughput"] = operations / float(self.window)
+    summary["error_rate"] = summary["errors"] / float(operations) if operations else 0.0
+
+  def record(self, timestamp, latency, error=False, **gauges):
+    """
+    Record an operation, the windows that ended late seconds before it finished get closed.
+    :param timestamp: time at which the operation started
+    :param latency: seconds
+    :param error: True if the operation failed
+    :param gauges: values stored with the windows that get closed, e.g. stored_games
+    """
+    index = max(0, int((timestamp - self.start) // self.window))
+    # Windows before this one ended late seconds before the operation finished
+    closed = int((timestamp + latency - self.late - self.start) // self.window)
+    with self.lock:
+      if index < len(self.windows):
+        summary = self.windows[index]
+        summary["operations"] += 1
+        summary["errors"] += 1 if error else 0
+        summary["late"] += 1
+        self._rates(summary)
+      else:
+        latencies, errors = self.open.get(index, (None, 0))
+        if latencies is None:
+          latencies = LatencyHistogram()
+        latencies.record(latency)
+        self.open[index] = (latencies, errors + 1 if error else errors)
+      while len(self.windows) < closed:
+        self._close(gauges)
+
+  def close(self, **gauges):
+    """
+    Close the windows in progress.
+    :return: list with the summary of every window
+    """
+    with self.lock:
+      if self.open:
+        last = max(self.open)
+        while len(self.windows) <= last:
+          self._close(gauges)
+      return self.windows
+
+
+def slope(xs, ys):
+  """
+  :return: slope of the least squares line of the points
+  """
+  n = float(len(xs))
+  mean_x, mean_y = sum(xs) / n, sum(ys) / n
+  variance = sum((x - mean_x) ** 2 for x in xs)
+  if not variance:
+    return 0.0
+  return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def trends(windows, key="p99", by="window"):
+  """
+  Fit a line to a metric of the windows.
+  :param windows: summaries returned by WindowedMetrics
+  :param key: metric, e.g. p99, error_rate
+  :param by: value on the x axis, e.g. window, stored_games
+  :return: dict with the slope and the fitted value at the first and last window
+  """
+  points = [(w[by], w[key]) for w in windows if by in w]
+  if len(points) < 2:
+    return None
+  xs, ys = zip(*points)
+  m = slope(xs, ys)
+  mean_x, mean_y = sum(xs) / float(len(xs)), sum(ys) / float(len(ys))
+  first, last = mean_y + m * (xs[0] - mean_x), mean_y + m * (xs[-1] - mean_x)
+  return {"slope": m, "first": first, "last": last}
+
+
+def degradation(windows, key="p99", by="window", threshold=0.5, relative=True):
+  """
+  Check if a metric grows along the run.
+  :param threshold: growth between the fitted first and last value that is flagged
+  :param relative: the threshold is relative to the first value, absolute otherwise
+  :return: message describing the degradation or None
+  """
+  trend = trends(windows, key, by)
+  if trend is None or trend["last"] <= trend["first"]:
+    return None
+  growth = trend["last"] - trend["first"]
+  if relative:
+    growth = growth / trend["first"] if trend["first"] > 0 else float("inf")
+  if growth <= threshold:
+    return None
+  return "{0} grows with {1}: from {2:.4f} to {3:.4f}, slope {4:.6g}".format(
+    key, by, trend["first"], trend["last"], trend["slope"])
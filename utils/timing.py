@@ -0,0 +1,180 @@
+import collections
+import json
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection, VerifiedHTTPSConnection
+from requests.packages.urllib3.poolmanager import PoolManager
+from utils.histogram import LatencyHistogram
+
+# Phases of a request in the order they happen
+PHASES = ("dns", "connect", "tls", "ttfb", "download", "json", "total")
+
+# Phases of the connection being established by the current thread
+_thread_local = threading.local()
+
+
+def connection_phases():
+  """
+  :return: dict with the connection phases measured in the current thread since the last reset
+  """
+  phases = getattr(_thread_local, "phases", None)
+  if phases is None:
+    phases = _thread_local.phases = dict()
+  return phases
+
+
+def reset_connection_phases():
+  connection_phases().clear()
+
+
+class TimedConnectionMixin(object):
+  """
+  Measure the DNS lookup, the TCP connection and the TLS handshake of new connections.
+  The DNS lookup is timed with a separate getaddrinfo call, so the connect phase only
+  includes the cached lookup done by urllib3.
+  """
+  tls = False
+
+  def _new_conn(self):
+    start = time.time()
+    socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)
+    resolved = time.time()
+    conn = super(TimedConnectionMixin, self)._new_conn()
+    self._connected = time.time()
+    phases = connection_phases()
+    phases["dns"] = resolved - start
+    phases["connect"] = self._connected - resolved
+    return conn
+
+  def connect(self):
+    super(TimedConnectionMixin, self).connect()
+    if self.tls:
+      connection_phases()["tls"] = time.time() - self._connected
+
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+  pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, VerifiedHTTPSConnection):
+  tls = True
+
+
+class TimedPoolManager(PoolManager):
+  connection_classes = {"http": TimedHTTPConnection, "https": TimedHTTPSConnection}
+
+  def _new_pool(self, scheme, host, port):
+    pool = super(TimedPoolManager, self)._new_pool(scheme, host, port)
+    pool.ConnectionCls = self.connection_classes[scheme]
+    return pool
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+  """
+  HTTPAdapter whose new connections record their phases with connection_phases.
+  """
+  def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+    self._pool_connections = connections
+    self._pool_maxsize = maxsize
+    self._pool_block = block
+    self.poolmanager = TimedPoolManager(num_pools=connections, maxsize=maxsize,
+                                        block=block, strict=True, **pool_kwargs)
+
+
+def endpoint_name(endpoint):
+  """
+  Name used to group the requests of an endpoint, the game ids are replaced.
+  :param endpoint: endpoint of the request, e.g. games/1234/claim
+  :return: name of the endpoint, e.g. games/{id}/claim
+  """
+  parts = endpoint.split("?", 1)[0].strip("/").split("/")
+  if len(parts) > 1 and parts[0] == "games":
+    parts[1] = "{id}"
+  return "/".join(parts)
+
+
+class TimingRecorder(object):
+  """
+  Keeps a latency histogram per endpoint and phase, it is safe to use from several threads.
+  """
+  def __init__(self):
+    self.histograms = collections.defaultdict(lambda: collections.defaultdict(LatencyHistogram))
+    self.lock = threading.Lock()
+
+  def record(self, endpoint, phase, seconds):
+    with self.lock:
+      self.histograms[endpoint][phase].record(seconds)
+
+  def record_request(self, endpoint, total, elapsed):
+    """
+    Record the phases of a request that just finished in the current thread.
+    :param endpoint: name of the endpoint
+    :param total: seconds spent in the whole call
+    :param elapsed: requests.Response.elapsed, time until the headers were parsed
+    """
+    phases = connection_phases()
+    elapsed = elapsed.total_seconds()
+    setup = sum(phases.values())
+    phases["ttfb"] = max(elapsed - setup, 0)
+    phases["download"] = max(total - elapsed, 0)
+    phases["total"] = total
+    with self.lock:
+      for phase, seconds in phases.items():
+        self.histograms[endpoint][phase].record(seconds)
+    reset_connection_phases()
+
+  def report(self):
+    """
+    :return: dict with the summary of every phase by endpoint
+    """
+    with self.lock:
+      return dict((endpoint, dict((phase, phases[phase].summary())
+                                  for phase in PHASES if phase in phases))
+                  for endpoint, phases in self.histograms.items())
+
+  def merge(self, other):
+    """
+    Add the requests recorded by other recorder to this one.
+    :param other: TimingRecorder
+    :return: self
+    """
+    with self.lock:
+      for endpoint, phases in other.histograms.items():
+        for phase, histogram in phases.items():
+          self.histograms[endpoint][phase].merge(histogram)
+    return self
+
+  def to_dict(self):
+    """
+    :return: dict with the serialized histogram of every phase by endpoint
+    """
+    with self.lock:
+      return dict((endpoint, dict((phase, histogram.to_dict())
+                                  for phase, histogram in phases.items()))
+                  for endpoint, phases in self.histograms.items())
+
+  @classmethod
+  def from_dict(cls, data):
+    """
+    :param data: dict created by to_dict
+    :return: TimingRecorder
+    """
+    recorder = cls()
+    for endpoint, phases in data.items():
+      for phase, histogram in phases.items():
+        recorder.histograms[endpoint][phase] = LatencyHistogram.from_dict(histogram)
+    return recorder
+
+  def write(self, path):
+    with open(path, "w") as f:
+      json.dump(self.report(), f, indent=2, sort_keys=True)
+
+  def reset(self):
+    with self.lock:
+      self.histograms.clear()
+
+
+# Recorder used by the helpers of LiarDiceTestBase
+RECORDER = TimingRecorder()
@@ -0,0 +1,141 @@
+import itertools
+import json
+import logging
+import threading
+import time
+from utils.load import LoadDriver, OpenLoopScheduler
+
+LOG = logging.getLogger(__name__)
+
+# Recorder used by LiarDiceTestBase.request, None when traces aren't being recorded
+RECORDER = None
+# Arguments of the calls written to the trace
+RECORDED_ARGUMENTS = ("params", "data", "json")
+
+
+class TraceRecorder(object):
+  """
+  Write every call made to the API as a line of json:
+
+    {"t": 0.0132, "method": "POST", "endpoint": "games", "data": {...}, "id": "<game id>"}
+
+  t is the number of seconds since the recorder was created and id the game created by
+  a POST to games, so the replay can map it to the game it creates. The query arguments of
+  the call, e.g. the skip and limit of a page of games, are recorded as params.
+  """
+  def __init__(self, path):
+    self.file = open(path, "w")
+    self.start = time.time()
+    self.lock = threading.Lock()
+
+  def record(self, method, endpoint, kwargs, r):
+    """
+    :param method: http method
+    :param endpoint: endpoint of the call
+    :param kwargs: arguments given to requests, params, data and json are recorded
+    :param r: requests.Response object
+    """
+    call = {"t": round(time.time() - self.start, 6), "method": method, "endpoint": endpoint}
+    for key in RECORDED_ARGUMENTS:
+      if kwargs.get(key) is not None:
+        call[key] = kwargs[key]
+    if method == "POST" and endpoint.strip("/") == "games":
+      try:
+        call["id"] = r.json()["_id"]
+      except (ValueError, KeyError, TypeError):
+        pass
+    line = json.dumps(call)
+    with self.lock:
+      self.file.write(line + "\n")
+
+  def close(self):
+    with self.lock:
+      self.file.close()
+
+
+def read_trace(path):
+  """
+  :param path: trace written by TraceRecorder
+  :return: generator of the calls, the file is read lazily
+  """
+  with open(path) as f:
+    for line in f:
+      if line.strip():
+        yield json.loads(line)
+
+
+class TraceReplayer(object):
+  """
+  Send the calls of a trace to the server with the endpoint helpers of a LiarDiceTestBase.
+  The game ids of the trace are replaced by the ids of the games created by the replay,
+  a call to a game waits until the replay has created it.
+  """
+  def __init__(self, client, path, speed=1.0, concurrency=100, max_in_flight=1000,
+               wait_timeout=60):
+    """
+    :param client: LiarDiceTestBase used to make the calls
+    :param path: trace written by TraceRecorder
+    :param speed: 1 replays the trace at the recorded pace, 2 twice as fast, ...
+    0 sends the calls as fast as possible
+    :param concurrency: requests in flight when replaying as fast as possible
+    :param max_in_flight: threads sending the requests when following the recorded pace
+    :param wait_timeout: seconds a call waits for the game it refers to
+    """
+    self.client = client
+    self.path = path
+    self.speed = speed
+    self.concurrency = concurrency
+    self.max_in_flight = max_in_flight
+    self.wait_timeout = wait_timeout
+    # Recorded id -> [threading.Event, id of the game created by the replay]
+    self.games = dict()
+
+  def run(self):
+    """
+    :return: utils.load.LoadResult of the calls
+    """
+    if not self.speed:
+      tasks = (self.task(call) for call in read_trace(self.path))
+      return LoadDriver(concurrency=self.concurrency).run(tasks)
+    # The arrivals are consumed together with the tasks, so the trace is read only once
+    calls, times = itertools.tee(read_trace(self.path))
+    arrivals = (call["t"] / self.speed for call in times)
+    tasks = (self.task(call) for call in calls)
+    return OpenLoopScheduler(arrivals, max_in_flight=self.max_in_flight).run(tasks)
+
+  def task(self, call):
+    """
+    Build the callable that replays a call. It runs in the thread reading the trace, so
+    the games are registered in the order they were created.
+    """
+    created = None
+    if "id" in call:
+      created = self.games[call["id"]] = [threading.Event(), None]
+    kwargs = dict((key, call[key]) for key in RECORDED_ARGUMENTS if key in call)
+
+    def replay():
+      endpoint = self.rewrite(call["endpoint"])
+      try:
+        r = self.client.request(call["method"], endpoint, **kwargs)
+        if created is not None:
+          created[1] = r.json()["_id"]
+      finally:
+        # Calls waiting for a game that failed to be created fail right away
+        if created is not None:
+          created[0].set()
+      if r.status_code >= 500:
+        raise Exception("{0} {1} failed with {2}".format(call["method"], endpoint,
+                                                           r.status_code))
+    return replay
+
+  def rewrite(self, endpoint):
+    """
+    Replace the recorded game id of an endpoint by the id of the replayed game.
+    """
+    parts = endpoint.split("/")
+    if len(parts) > 1 and parts[0] == "games" and parts[1] in self.games:
+      created = self.games[parts[1]]
+      if not created[0].wait(self.wait_timeout) or created[1] is None:
+        raise Exception("Game %s wasn't created by the replay." % parts[1])
+      parts[1] = created[1]
+    return "/".join(parts)
@@ -0,0 +1,467 @@
+import collections
+import datetime
+import json
+import logging
+import socket
+import ssl
+import time
+import urllib
+from urlparse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, requote_uri
+
+LOG = logging.getLogger(__name__)
+
+TRANSPORTS = ("requests", "raw")
+# Bytes read from the sockets at once
+BUFFER_SIZE = 64 * 1024
+# Longest status or header line accepted
+MAX_LINE = 64 * 1024
+USER_AGENT = "liars-dice-tests"
+# Arguments of requests.Session.request understood by the RawTransport
+RAW_ARGUMENTS = frozenset(("params", "data", "json", "headers", "stream", "verify", "timeout"))
+
+
+class Transport(object):
+  """
+  Makes the HTTP calls of a thread. Every backend has a request(method, url, **kwargs) that
+  takes the arguments of requests.Session.request, so the tests don't depend on the backend,
+  and returns a requests.Response or an object with the same attributes. pipeline sends
+  several calls at once when the backend can.
+  """
+  def pipeline(self, calls):
+    """
+    :param calls: list of (method, url, kwargs)
+    :return: list of the responses, in the order of the calls
+    """
+    return [self.request(method, url, **kwargs) for method, url, kwargs in calls]
+
+  def close(self):
+    pass
+
+
+class RequestsTransport(Transport):
+  """
+  Calls made with a requests.Session, the pipeline is sequential.
+  """
+  def __init__(self, session):
+    self.session = session
+
+  def request(self, method, url, **kwargs):
+    return self.session.request(method, url, **kwargs)
+
+  def close(self):
+    self.session.close()
+
+
+class ConnectionClosed(Exception):
+  """
+  The server closed the connection before sending any byte of a response
+  """
+  pass
+
+
+class RawTransport(Transport):
+  """
+  Lean HTTP/1.1 client on persistent sockets: a call costs formatting the request, a sendall
+  and parsing the response, without the hooks, adapters and urllib3 pool of requests. Calls
+  to the same server can be pipelined, they are written at once on a connection and the
+  responses are read in order. Every thread needs its own transport.
+
+    transport = RawTransport()
+    responses = transport.pipeline([("GET", url, {})] * 10)
+  """
+  def __init__(self, pool_size=10, keep_alive=True, max_retries=0, retry_backoff=0,
+               timeout=None):
+    """
+    :param pool_size: idle connections kept by server
+    :param keep_alive: reuse the connections, otherwise every call has its own
+    :param max_retries: times a call is sent again after a connection error
+    :param retry_backoff: the nth retry waits retry_backoff * 2 ** (n - 1) seconds
+    :param timeout: seconds the sockets wait, None waits forever
+    """
+    self.pool_size = pool_size
+    self.keep_alive = keep_alive
+    self.max_retries = max_retries
+    self.retry_backoff = retry_backoff
+    self.timeout = timeout
+    # (scheme, host, port) -> idle connections
+    self.idle = collections.defaultdict(list)
+
+  def request(self, method, url, **kwargs):
+    return self.pipeline([(method, url, kwargs)])[0]
+
+  def pipeline(self, calls):
+    """
+    :param calls: list of (method, url, kwargs) to the same server, stream is only allowed
+    for a single call
+    :return: list of RawResponse
+    :raises requests.exceptions.ConnectionError if the calls can't be completed
+    """
+    calls = [prepare(method, url, self.keep_alive, **kwargs) for method, url, kwargs in calls]
+    if len(set(call.origin for call in calls)) > 1:
+      raise ValueError("The calls of a pipeline must go to the same server.")
+    stream = len(calls) == 1 and calls[0].stream
+    responses = list()
+    retries = 0
+    while len(responses) < len(calls):
+      pending = calls[len(responses):]
+      connection = self.connection(pending[0])
+      answered = len(responses)
+      start = time.time()
+      try:
+        connection.send("".join(call.data for call in pending))
+        for call in pending:
+          response, keep = connection.read_response(call, start, stream, self.release)
+          responses.append(response)
+          if not keep:
+            break
+      except (socket.error, ConnectionClosed) as e:
+        connection.close()
+        # The server closed an idle connection, or stopped answering the pipeline after some
+        # responses, the calls left are sent on a new connection
+        progress = len(responses) > answered
+        if connection.reused and not progress or isinstance(e, ConnectionClosed) and progress:
+          continue
+        retries += 1
+        if retries > self.max_retries:
+          raise requests.exceptions.ConnectionError(e)
+        if self.retry_backoff:
+          time.sleep(self.retry_backoff * 2 ** (retries - 1))
+        continue
+      if not stream:
+        self.release(connection, keep)
+    return responses
+
+  def connection(self, call):
+    idle = self.idle[call.origin]
+    if idle:
+      return idle.pop()
+    try:
+      return Connection(call.origin, call.timeout or self.timeout, call.verify)
+    except socket.error as e:
+      raise requests.exceptions.ConnectionError(e)
+
+  def release(self, connection, keep):
+    """
+    Keep a connection whose responses have been read to be reused, or close it.
+    """
+    if keep and len(self.idle[connection.origin]) < self.pool_size:
+      connection.reused = True
+      self.idle[connection.origin].append(connection)
+    else:
+      connection.close()
+
+  def close(self):
+    for connections in self.idle.values():
+      for connection in connections:
+        connection.close()
+    self.idle.clear()
+
+
+class Connection(object):
+  """
+  Socket to a server with a buffered file to read the responses
+  """
+  def __init__(self, origin, timeout=None, verify=True):
+    """
+    :param origin: (scheme, host, port)
+    :param timeout: seconds the socket waits, None waits forever
+    :param verify: check the certificate of an https server, or path of the CA bundle
+    """
+    scheme, host, port = origin
+    self.origin = origin
+    self.reused = False
+    sock = socket.create_connection((host, port), timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if scheme == "https":
+      context = ssl.create_default_context(
+        cafile=verify if isinstance(verify, basestring) else None)
+      if verify is False:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+      sock = context.wrap_socket(sock, server_hostname=host)
+    self.sock = sock
+    self.file = sock.makefile("rb", BUFFER_SIZE)
+
+  def send(self, data):
+    self.sock.sendall(data)
+
+  def close(self):
+    self.file.close()
+    self.sock.close()
+
+  def read_response(self, call, start, stream=False, release=None):
+    """
+    :param call: Call the response answers
+    :param start: time at which the call was sent
+    :param stream: leave the body in the socket until it's iterated
+    :param release: callable(connection, keep) that takes the connection back once a streamed
+    body has been read
+    :return: RawResponse and whether the connection can be reused after it
+    :raises ConnectionClosed if the server closed the connection without answering
+    """
+    while True:
+      line = self.file.readline(MAX_LINE)
+      if not line:
+        raise ConnectionClosed("The server closed the connection.")
+      version, status, reason = parse_status(line)
+      headers = self.read_headers()
+      # 1xx responses come before the final one
+      if not 100 <= status < 200:
+        break
+    elapsed = datetime.timedelta(seconds=time.time() - start)
+    if call.method == "HEAD" or status in (204, 304):
+      length = 0
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+      length = "chunked"
+    elif "content-length" in headers:
+      length = int(headers["content-length"])
+    else:
+      # The body ends when the server closes the connection
+      length = None
+    connection = headers.get("connection", "").lower()
+    keep = (call.keep_alive and length is not None and "close" not in connection and
+            (version == "HTTP/1.1" or "keep-alive" in connection))
+    if stream and length != 0:
+      return RawResponse(call, status, reason, headers, elapsed,
+                         chunks=lambda chunk_size: self.body(length, chunk_size),
+                         done=lambda complete: release(self, keep and complete)), keep
+    content = "".join(self.body(length, BUFFER_SIZE))
+    if stream:
+      release(self, keep)
+    return RawResponse(call, status, reason, headers, elapsed, content=content), keep
+
+  def read_headers(self):
+    headers = CaseInsensitiveDict()
+    while True:
+      line = self.file.readline(MAX_LINE)
+      if line in ("\r\n", "\n"):
+        return headers
+      if not line:
+        raise socket.error("The connection was closed in the headers.")
+      name, _, value = line.partition(":")
+      name, value = name.strip(), value.strip()
+      headers[name] = "%s, %s" % (headers[name], value) if name in headers else value
+
+  def body(self, length, chunk_size):
+    """
+    :param length: bytes of the body, "chunked" or None to read until the connection closes
+    :return: generator of the chunks of the body
+    """
+    read = self.file.read
+    if length == "chunked":
+      while True:
+        size = int(self.file.readline(MAX_LINE).split(";", 1)[0].strip() or "0", 16)
+        if size == 0:
+          # Trailers
+          while self.file.readline(MAX_LINE) not in ("\r\n", "\n", ""):
+            pass
+          return
+        for chunk in self.read_exactly(size, chunk_size):
+          yield chunk
+        self.file.readline(MAX_LINE)
+    elif length is None:
+      chunk = read(chunk_size)
+      while chunk:
+        yield chunk
+        chunk = read(chunk_size)
+    else:
+      for chunk in self.read_exactly(length, chunk_size):
+        yield chunk
+
+  def read_exactly(self, length, chunk_size):
+    while length > 0:
+      chunk = self.file.read(min(length, chunk_size))
+      if not chunk:
+        raise socket.error("The connection was closed in the body.")
+      length -= len(chunk)
+      yield chunk
+
+
+class Call(object):
+  """
+  Request prepared by the RawTransport, it has the attributes of requests.PreparedRequest
+  used to describe the failures.
+  """
+  def __init__(self, method, url, origin, target, headers, body, keep_alive=True,
+               stream=False, verify=True, timeout=None):
+    self.method = method
+    self.url = url
+    self.origin = origin
+    self.headers = headers
+    self.body = body
+    self.keep_alive = keep_alive
+    self.stream = stream
+    self.verify = verify
+    self.timeout = timeout
+    lines = [_utf8("%s %s HTTP/1.1" % (method, target))]
+    lines.extend(_utf8("%s: %s" % item) for item in headers.items())
+    self.data = "\r\n".join(lines) + "\r\n\r\n" + (body or "")
+
+
+def prepare(method, url, keep_alive=True, **kwargs):
+  """
+  Build a call from the arguments of requests.Session.request, the url and the body are
+  encoded the way requests does.
+  :return: Call
+  """
+  unknown = set(kwargs).difference(RAW_ARGUMENTS)
+  if unknown:
+    raise ValueError("The raw transport doesn't support %s." % ", ".join(sorted(unknown)))
+  method = method.upper()
+  parts = urlsplit(url)
+  scheme = parts.scheme.lower()
+  port = parts.port or (443 if scheme == "https" else 80)
+  query = parts.query
+  if kwargs.get("params"):
+    params = encode_params(kwargs["params"])
+    query = "%s&%s" % (query, params) if query else params
+  target = requote_uri(_utf8(parts.path or "/") + ("?" + query if query else ""))
+  headers = CaseInsensitiveDict()
+  headers["Host"] = parts.hostname if parts.port in (None, 80, 443) else parts.netloc
+  headers["User-Agent"] = USER_AGENT
+  headers["Accept"] = "*/*"
+  headers["Connection"] = "keep-alive" if keep_alive else "close"
+  body = None
+  if kwargs.get("data"):
+    body = encode_params(kwargs["data"])
+    if not isinstance(kwargs["data"], basestring):
+      headers["Content-Type"] = "application/x-www-form-urlencoded"
+  elif kwargs.get("json") is not None:
+    body = json.dumps(kwargs["json"])
+    headers["Content-Type"] = "application/json"
+  if body is not None:
+    headers["Content-Length"] = str(len(body))
+  elif method not in ("GET", "HEAD"):
+    headers["Content-Length"] = "0"
+  for name, value in (kwargs.get("headers") or {}).items():
+    headers[name] = value
+  return Call(method, url, (scheme, parts.hostname, port), target, headers, body,
+              keep_alive=headers["Connection"].lower() != "close",
+              stream=kwargs.get("stream", False), verify=kwargs.get("verify", True),
+              timeout=kwargs.get("timeout"))
+
+
+def encode_params(data):
+  """
+  Form encode a dict (or list of pairs) like requests does: a list gives a key several
+  values and None values are left out. Strings are sent as they are.
+  """
+  if isinstance(data, basestring):
+    return _utf8(data)
+  pairs = list()
+  for key, values in (data.items() if isinstance(data, dict) else data):
+    if isinstance(values, basestring) or not hasattr(values, "__iter__"):
+      values = [values]
+    for value in values:
+      if value is not None:
+        pairs.append((_utf8(key), _utf8(value)))
+  return urllib.urlencode(pairs, doseq=True)
+
+
+def _utf8(value):
+  return value.encode("utf-8") if isinstance(value, unicode) else value
+
+
+def parse_status(line):
+  """
+  :return: version, status code and reason of a status line
+  """
+  parts = line.split(None, 2)
+  try:
+    if not parts[0].startswith("HTTP/"):
+      raise ValueError()
+    return parts[0], int(parts[1]), parts[2].strip() if len(parts) > 2 else ""
+  except (IndexError, ValueError):
+    raise socket.error("Invalid status line %r" % line[:100])
+
+
+class RawResponse(object):
+  """
+  Response of the RawTransport with the attributes of requests.Response used by the tests
+  """
+  def __init__(self, request, status_code, reason, headers, elapsed, content=None,
+               chunks=None, done=None):
+    """
+    :param request: Call answered
+    :param content: body, None if it's streamed
+    :param chunks: callable(chunk_size) returning the generator of the streamed body
+    :param done: callable(complete) called once the streamed body has been read or closed
+    """
+    self.request = request
+    self.url = request.url
+    self.status_code = status_code
+    self.reason = reason
+    self.headers = headers
+    self.elapsed = elapsed
+    self.history = list()
+    self._content = content
+    self._chunks = chunks
+    self._done = done
+    self._consumed = content is not None
+
+  @property
+  def encoding(self):
+    return get_encoding_from_headers(self.headers)
+
+  @property
+  def content(self):
+    if self._content is None:
+      if self._consumed:
+        raise RuntimeError("The content of the response was already consumed.")
+      self._content = "".join(self.iter_content(BUFFER_SIZE))
+    return self._content
+
+  @property
+  def text(self):
+    return self.content.decode(self.encoding or "utf-8", "replace")
+
+  @property
+  def ok(self):
+    return self.status_code < 400
+
+  def json(self, **kwargs):
+    return json.loads(self.content, **kwargs)
+
+  def iter_content(self, chunk_size=1, decode_unicode=False):
+    """
+    :param chunk_size: bytes of the chunks at most
+    :return: generator of the chunks of the body
+    """
+    if self._content is not None:
+      content = self._content
+      return (content[i:i + chunk_size] for i in xrange(0, len(content), chunk_size))
+    if self._consumed:
+      raise RuntimeError("The content of the response was already consumed.")
+    self._consumed = True
+    return self._stream(chunk_size)
+
+  def _stream(self, chunk_size):
+    complete = False
+    try:
+      for chunk in self._chunks(chunk_size):
+        yield chunk
+      complete = True
+    except socket.error as e:
+      raise requests.exceptions.ConnectionError(e)
+    finally:
+      self._release(complete)
+
+  def _release(self, complete):
+    if self._done is not None:
+      done, self._done = self._done, None
+      done(complete)
+
+  def raise_for_status(self):
+    if self.status_code >= 400:
+      raise requests.exceptions.HTTPError("%s %s for url: %s" % (self.status_code, self.reason,
+                                                                self.url), response=self)
+
+  def close(self):
+    """
+    Close the connection if the streamed body wasn't read entirely.
+    """
+    self._release(False)
@@ -0,0 +1,170 @@
+import array
+import bisect
+import collections
+import hashlib
+import logging
+from utils.load import LoadDriver
+
+LOG = logging.getLogger(__name__)
+
+# Digests are kept in unsigned longs, 64 bits wide on most platforms but 32 on Windows
+DIGEST_BYTES = array.array("L").itemsize
+
+
+def digest(id):
+  """
+  :return: the first bytes of the md5 of the id as an integer, the same on every platform
+  """
+  if isinstance(id, unicode):
+    id = id.encode("utf-8")
+  return int(hashlib.md5(str(id)).hexdigest()[:2 * DIGEST_BYTES], 16)
+
+
+class DigestSet(object):
+  """
+  Sorted array of the digests of a set of ids, it takes 8 bytes per id instead of the tens
+  of bytes of a string in a set. Two ids sharing a 64 bit digest are possible but, for a run
+  of a million games, about as likely as one in ten million; with the 32 bit unsigned longs
+  of Windows they are likely, so the repeated digests are only candidates to be checked
+  against the ids.
+  """
+  def __init__(self, ids=(), digests=None):
+    """
+    :param ids: iterable of ids
+    :param digests: iterable of digests already computed, instead of the ids
+    """
+    if digests is None:
+      digests = (digest(id) for id in ids)
+    self.digests = array.array("L", sorted(digests))
+
+  def __len__(self):
+    return len(self.digests)
+
+  def __contains__(self, id):
+    value = digest(id)
+    index = bisect.bisect_left(self.digests, value)
+    return index < len(self.digests) and self.digests[index] == value
+
+  def repeated(self):
+    """
+    :return: set of the digests that appear more than once, the ids may still be different
+    """
+    digests = self.digests
+    return set(digests[i] for i in xrange(1, len(digests)) if digests[i] == digests[i - 1])
+
+
+class VerificationResult(object):
+  """
+  Games created by a run that the server lost or duplicated
+  """
+  def __init__(self):
+    self.created = 0
+    self.listed = 0
+    # Ids returned by more than one creation
+    self.duplicated = list()
+    # Ids listed more than once by list_games
+    self.listed_twice = list()
+    # Ids missing from list_games
+    self.unlisted = list()
+    # Ids get_game didn't return, with the reason
+    self.lost = list()
+
+  @property
+  def ok(self):
+    return not (self.duplicated or self.listed_twice or self.unlisted or self.lost)
+
+  def report(self, limit=20):
+    """
+    :param limit: number of ids shown of every problem
+    :return: description of the problems found
+    """
+    lines = ["{0} games created, {1} games listed".format(self.created, self.listed)]
+    problems = (("duplicated", self.duplicated), ("listed more than once", self.listed_twice),
+                ("not listed", self.unlisted), ("lost", self.lost))
+    for name, ids in problems:
+      if ids:
+        lines.append("{0} {1}: {2}{3}".format(len(ids), name,
+                                              ", ".join(str(id) for id in ids[:limit]),
+                                              "..." if len(ids) > limit else ""))
+    return "\n".join(lines)
+
+
+class GameVerifier(object):
+  """
+  Check that the games created by a run exist, are unique and are listed. The ids are
+  streamed once: every id is checked against one streamed pass of list_games and read with
+  get_game by a bounded number of threads.
+
+    result = GameVerifier(self).run(game_ids)
+  """
+  def __init__(self, client, concurrency=20):
+    """
+    :param client: LiarDiceTestBase used to make the calls
+    :param concurrency: number of get_game requests in flight
+    """
+    self.client = client
+    self.concurrency = concurrency
+
+  def run(self, ids):
+    """
+    :param ids: iterable of the ids of the created games, consumed once
+    :return: VerificationResult
+    """
+    result = VerificationResult()
+    listed = self.listed_ids(result)
+    created = array.array("L")
+
+    def tasks():
+      for id in ids:
+        created.append(digest(id))
+        if id not in listed:
+          result.unlisted.append(id)
+        yield self.task(id)
+
+    outcomes = LoadDriver(concurrency=self.concurrency).run(tasks())
+    result.lost.extend(outcomes.errors)
+    result.created = len(created)
+    repeated = DigestSet(digests=created).repeated()
+    if repeated:
+      # Only the ids that were read back can be named
+      result.duplicated = seen_twice(id for id in outcomes.results if digest(id) in repeated)
+    LOG.info("Verified {0} games: {1} duplicated, {2} not listed, {3} lost".format(
+      result.created, len(result.duplicated), len(result.unlisted), len(result.lost)))
+    return result
+
+  def listed_ids(self, result):
+    """
+    :return: DigestSet of the ids returned by list_games
+    """
+    page_size = self.client.list_page_size
+    listed = DigestSet(game["_id"] for game in self.client.iter_games(page_size))
+    result.listed = len(listed)
+    repeated = listed.repeated()
+    if repeated:
+      # Named with a second pass, the first one only kept the digests
+      result.listed_twice = seen_twice(game["_id"] for game in self.client.iter_games(page_size)
+                                       if digest(game["_id"]) in repeated)
+    return listed
+
+  def task(self, id):
+    def read():
+      # The game cache is skipped, the server has to answer
+      r = self.client.get("games/{0}".format(id))
+      try:
+        game = r.json()
+      except ValueError:
+        raise Exception("{0}: invalid response with status {1}".format(id, r.status_code))
+      if r.status_code != 200 or not isinstance(game, dict) or game.get("_id") != id:
+        raise Exception("{0}: {1}".format(id, game.get("error") if isinstance(game, dict)
+                                               else game))
+      return id
+    return read
+
+
+def seen_twice(ids):
+  """
+  :param ids: iterable of the ids whose digest is repeated
+  :return: sorted list of the ids that appear more than once, the ids that only share the
+  digest with another one are left out
+  """
+  return sorted(id for id, count in collections.Counter(ids).items() if count > 1)